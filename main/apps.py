@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "main"
+
+    def ready(self):
+        from django.conf import settings
+        from django.core import checks
+        from django.db.backends.signals import connection_created
+
+        from main import signals  # noqa: F401
+        from main.checks import check_user_cache, check_webhook_caches
+        from main.metrics import instrument_connection
+
+        checks.register(check_user_cache)
+        checks.register(check_webhook_caches)
+
+        if settings.METRICS["ENABLED"]:
+            connection_created.connect(instrument_connection)
@@ -0,0 +1,74 @@
+import copy
+import time
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from main.cache import build_cache
+from main.metrics import CACHE_COUNTERS
+from main.routers import read_primary
+
+_user_cache = None
+
+
+def get_user_cache():
+    """
+    Returns the cache of users resolved from access tokens, built from
+    `settings.AUTH_USER_CACHE` on first use.
+    """
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = build_cache(settings.AUTH_USER_CACHE, prefix="jwt_user:")
+        CACHE_COUNTERS.register("jwt_users", _user_cache.stats)
+    return _user_cache
+
+
+def invalidate_user(user_id, using=None):
+    """
+    Drops the cached user now and again once the current transaction
+    commits, so a request reading the old row meanwhile cannot keep it cached.
+    """
+    cache = get_user_cache()
+    cache.delete(str(user_id))
+    transaction.on_commit(lambda: cache.delete(str(user_id)), using=using)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    `JWTAuthentication` that caches the user loaded for a token until the
+    token expires (at most `AUTH_USER_CACHE["TIMEOUT"]`), so authenticated
+    requests skip the user query. Entries are keyed by user id, shared by
+    all of the user's tokens, and dropped whenever the user is saved or
+    deleted, which covers deactivation, soft deletion and password changes.
+
+    The drop only reaches other workers through a shared cache; with a
+    per-process one they keep the old user for up to the TIMEOUT, which is
+    why it defaults to a few seconds then. Misses are loaded from the
+    primary, so a lagging replica cannot put an outdated user back in the
+    cache. Writes that skip model signals,
+    such as `QuerySet.update()` or raw SQL, must call `invalidate_user` for
+    each changed account, or the old user is served until the entry expires.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        cache = get_user_cache()
+        user = cache.get(str(user_id))
+        if user is not None and user.is_active and not user.is_deleted:
+            # a copy, so a request changing its user cannot alter the cached one
+            return copy.copy(user)
+
+        # a replica may not have the write that invalidated the entry yet
+        with read_primary():
+            user = super().get_user(validated_token)
+        timeout = min(
+            settings.AUTH_USER_CACHE["TIMEOUT"], validated_token["exp"] - time.time()
+        )
+        if timeout > 0:
+            cache.set(str(user_id), user, timeout=int(timeout))
+        return user
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class CacheStats:
+    """
+    Thread-safe hit/miss counters shared by the cache backends.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_eviction(self):
+        with self._lock:
+            self.evictions += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class LocalTTLCache:
+    """
+    In-process cache with a per-entry TTL and LRU eviction once
+    `max_entries` is reached. Safe to share between request threads.
+
+    Args:
+        timeout (int): Default time-to-live of an entry, in seconds.
+        max_entries (int): Maximum number of entries kept before the least
+            recently used one is evicted.
+    """
+
+    def __init__(self, timeout=300, max_entries=1024):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._data[key]
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+        self.stats.record(entry is not None)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.stats.record_eviction()
+
+    async def aget(self, key, default=None):
+        return self.get(key, default)
+
+    async def aset(self, key, value, timeout=None):
+        self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """
+    Adapter over a Django cache alias so entries are shared between workers.
+    Size bounds and eviction are left to the configured cache backend.
+
+    Args:
+        alias (str): Name of the cache in `settings.CACHES`.
+        prefix (str): Prefix added to every key to namespace the entries.
+        timeout (int): Default time-to-live of an entry, in seconds.
+    """
+
+    def __init__(self, alias="default", prefix="", timeout=300):
+        self.alias = alias
+        self.prefix = prefix
+        self.timeout = timeout
+        self.stats = CacheStats()
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    def get(self, key, default=None):
+        value = self._cache.get(self._key(key), _MISSING)
+        self.stats.record(value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, timeout=None):
+        self._cache.set(
+            self._key(key), value, self.timeout if timeout is None else timeout
+        )
+
+    async def aget(self, key, default=None):
+        value = await self._cache.aget(self._key(key), _MISSING)
+        self.stats.record(value is not _MISSING)
+        return default if value is _MISSING else value
+
+    async def aset(self, key, value, timeout=None):
+        await self._cache.aset(
+            self._key(key), value, self.timeout if timeout is None else timeout
+        )
+
+    def delete(self, key):
+        self._cache.delete(self._key(key))
+
+    def clear(self):
+        # a shared cache cannot be cleared per prefix; entries age out instead
+        pass
+
+
+def build_cache(config, prefix=""):
+    """
+    Builds a cache backend from a settings dictionary.
+
+    Args:
+        config (dict): Cache options: BACKEND ("local" or "django"), TIMEOUT,
+            MAX_ENTRIES and CACHE_ALIAS.
+        prefix (str): Key prefix used by the shared Django backend.
+
+    Returns:
+        LocalTTLCache | DjangoCacheBackend: The configured cache backend.
+
+    Raises:
+        ValueError: If the backend name is not supported.
+    """
+    backend = config.get("BACKEND", "local")
+    timeout = config.get("TIMEOUT", 300)
+
+    if backend == "local":
+        return LocalTTLCache(
+            timeout=timeout, max_entries=config.get("MAX_ENTRIES", 1024)
+        )
+    if backend == "django":
+        return DjangoCacheBackend(
+            alias=config.get("CACHE_ALIAS", "default"), prefix=prefix, timeout=timeout
+        )
+    raise ValueError(f"Unsupported cache backend: {backend}")
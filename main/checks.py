@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.checks import Warning
+
+# longest a per-process user cache may keep entries without a warning
+LOCAL_USER_CACHE_TIMEOUT = 30
+
+
+def is_shared_cache(alias):
+    """Whether `CACHES[alias]` is reachable from every worker process."""
+    backend = settings.CACHES.get(alias, {}).get("BACKEND")
+    return backend is not None and backend not in settings.LOCAL_CACHE_BACKENDS
+
+
+def check_webhook_caches(app_configs, **kwargs):
+    """
+    Nylas webhooks are delivered to a single worker, so the participants
+    they fetch only help the others through a shared participant cache.
+    """
+    if not settings.NYLAS_WEBHOOK["SECRET"]:
+        return []
+    config = settings.PARTICIPANT_CACHE
+    if config["BACKEND"] == "django" and is_shared_cache(config["CACHE_ALIAS"]):
+        return []
+    return [
+        Warning(
+            "Nylas webhooks only warm the participant cache of the worker "
+            "that receives them.",
+            hint="Set PARTICIPANT_CACHE_BACKEND=django and point "
+            "PARTICIPANT_CACHE_ALIAS at a cache shared by all workers "
+            "(CACHE_BACKEND).",
+            id="main.W001",
+        )
+    ]
+
+
+def check_user_cache(app_configs, **kwargs):
+    """
+    Users cached per process outlive their deactivation on the other workers
+    until the entry expires, so that window must stay short.
+    """
+    config = settings.AUTH_USER_CACHE
+    shared = config["BACKEND"] == "django" and is_shared_cache(config["CACHE_ALIAS"])
+    if shared or config["TIMEOUT"] <= LOCAL_USER_CACHE_TIMEOUT:
+        return []
+    return [
+        Warning(
+            "Authenticated users are cached per process for up to "
+            f"{config['TIMEOUT']} seconds, so other workers keep accepting a "
+            "deactivated account that long.",
+            hint="Use AUTH_USER_CACHE_BACKEND=django on a cache shared by all "
+            "workers (CACHE_BACKEND), or set AUTH_USER_CACHE_TTL to at most "
+            f"{LOCAL_USER_CACHE_TIMEOUT}.",
+            id="main.W002",
+        )
+    ]
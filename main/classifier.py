@@ -0,0 +1,105 @@
+import re
+
+# names the LLM prompt uses for each label, so both paths return the same categories
+CATEGORY_NAMES = {
+    "task": "Task",
+    "meeting_request": "Meeting Request",
+    "follow-up": "Follow-up",
+    "question": "Question",
+    "deadline": "Deadline",
+    "approval": "Approval",
+    "feedback": "Feedback",
+    "review": "Review",
+}
+
+_WEEKDAY = r"(monday|tuesday|wednesday|thursday|friday|saturday|sunday|mon|tue|wed|thu|fri)"
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*"
+_TIME = r"\b\d{1,2}(:\d{2})?\s?(am|pm)\b|\b\d{1,2}:\d{2}\b"
+_DATE = (
+    rf"\b\d{{1,2}}(st|nd|rd|th)?\s+{_MONTH}\b|\b{_MONTH}\s+\d{{1,2}}(st|nd|rd|th)?\b"
+    r"|\b\d{1,2}[/-]\d{1,2}([/-]\d{2,4})?\b"
+)
+
+# (label, pattern, weight): weights of matching rules are combined with a
+# noisy-or, so several weak signals add up to a confident label. No single
+# weight reaches the default THRESHOLD (0.8): one keyword on its own is never
+# enough to skip the LLM, only corroborated matches are
+RULES = [
+    ("task", r"\b(please|kindly|make sure|ensure|action items?|to-?do)\b", 0.5),
+    ("task", r"\b(can|could|would) you\b|\bneed (you|someone) to\b", 0.5),
+    ("task", r"^\s*(send|prepare|update|create|draft|fix|book|call|ask|share|submit|complete)\b", 0.7),
+    ("meeting_request", r"\b(meeting|meet up|let'?s meet|catch up|sync up|call|dialogue|discussion)\b", 0.55),
+    ("meeting_request", r"\b(schedule|calendar|invite|zoom|google meet|teams call|my office|available)\b", 0.5),
+    ("meeting_request", _TIME, 0.45),
+    ("follow-up", r"\bfollow(ing)?[- ]?up\b|\bcircl(e|ing) back\b|\bchecking in\b", 0.7),
+    ("follow-up", r"\b(any updates?|gentle reminder|just a reminder|reminder|still waiting)\b", 0.7),
+    ("question", r"\?", 0.7),
+    ("question", r"^\s*(who|what|when|where|why|how|which|is|are|do|does|did|can|could|would|should)\b", 0.5),
+    ("deadline", r"\b(deadline|due( date)?|no later than|asap|urgent(ly)?|eod|cob|end of (the )?(day|week|month))\b", 0.7),
+    ("deadline", rf"\bby\s+(tomorrow|today|tonight|next week|{_WEEKDAY})\b", 0.7),
+    ("deadline", _DATE, 0.45),
+    ("approval", r"\b(approve|approved|approval|sign[- ]?off|authori[sz]e|authori[sz]ation|green light|go[- ]ahead)\b", 0.7),
+    ("feedback", r"\b(feedback|thoughts|your opinion|suggestions?|let me know what you think|input on)\b", 0.7),
+    ("review", r"\b(review|proofread|look (over|through)|go through|take a look|check (the|this|my))\b", 0.7),
+    ("review", r"\b(materials?|draft|document|attached|attachment|proposal|report)\b", 0.35),
+]
+
+_COMPILED = [
+    (label, re.compile(pattern, re.IGNORECASE | re.MULTILINE), weight)
+    for label, pattern, weight in RULES
+]
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def classify_text(text, min_confidence=0.3):
+    """
+    Scores `text` against the keyword, date and punctuation rules of every
+    annotation label without calling out to a model.
+
+    Args:
+        text (str): Text to classify.
+        min_confidence (float): Labels scoring below this are dropped.
+
+    Returns:
+        List[dict]: Matching labels sorted by confidence, each with the
+            "label", its "confidence" (0-1) and the "sentence" it was found in.
+    """
+    sentences = [s.strip() for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+    misses = {}
+    evidence = {}
+    matched = set()
+
+    for sentence in sentences:
+        for index, (label, pattern, weight) in enumerate(_COMPILED):
+            # a rule counts once however many sentences it matches, so a
+            # repeated keyword does not corroborate itself
+            if index in matched or not pattern.search(sentence):
+                continue
+            matched.add(index)
+            misses[label] = misses.get(label, 1.0) * (1 - weight)
+            evidence.setdefault(label, sentence)
+
+    results = [
+        {
+            "label": label,
+            "confidence": round(1 - miss, 3),
+            "sentence": evidence[label],
+        }
+        for label, miss in misses.items()
+        if 1 - miss >= min_confidence
+    ]
+    return sorted(results, key=lambda result: result["confidence"], reverse=True)
+
+
+def to_annotations(results):
+    """
+    Formats classifier results like the parsed LLM response.
+    """
+    return [
+        {
+            "Category": CATEGORY_NAMES[result["label"]],
+            "Annotation": result["sentence"],
+            "Confidence": result["confidence"],
+        }
+        for result in results
+    ]
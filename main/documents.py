@@ -0,0 +1,150 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from main.cache import CacheStats
+from main.metrics import CACHE_COUNTERS
+from main.models import Annotation, ResourceVersion, normalize_email_id
+from main.routers import read_primary
+from main.serializer import RetrieveAnnotationSerializer, ThreadOverviewSerializer
+
+_thread_documents = None
+
+
+class ThreadDocumentStore:
+    """
+    Pre-serialized annotations of each thread, kept in a Django cache so a
+    hot thread is served by one cache round trip instead of a query plus
+    serializer run.
+
+    Every thread has a version marker next to its document. Writes replace
+    the marker with a new random token once their transaction commits, and
+    documents remember the token that was current when their rows were
+    read. A document whose token no longer matches is rebuilt, so a reader
+    racing a writer can never store a document that outlives the write.
+
+    Documents are built from the primary, since a replica that has not
+    caught up with a write would store stale rows under the token of that
+    write. Each one records the thread's `ResourceVersion` read just before
+    its rows, so a request that already saw a newer version (e.g. for its
+    ETag) never gets an older document.
+
+    Args:
+        config (dict): `ENABLED`, `CACHE_ALIAS`, `TIMEOUT` (upper bound on the
+            age of a document, which also caps staleness if an invalidation
+            is lost), `STALE_SECONDS` (how long after a write the previous
+            document may still be served) and `COMMENTS` (newest comments
+            kept per annotation).
+    """
+
+    def __init__(self, config):
+        self.enabled = config.get("ENABLED", True)
+        self.alias = config.get("CACHE_ALIAS", "default")
+        self.timeout = config.get("TIMEOUT", 60)
+        self.stale_seconds = config.get("STALE_SECONDS", 0)
+        self.comments = config.get("COMMENTS", 3)
+        self.stats = CacheStats()
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _keys(email_key):
+        return f"thread-doc:{email_key}", f"thread-doc-version:{email_key}"
+
+    def build(self, email_key):
+        queryset = (
+            Annotation.objects.filter(email_key=email_key, is_deleted=False)
+            .with_comment_summary(latest=self.comments)
+        )
+        return ThreadOverviewSerializer(queryset, many=True).data
+
+    def build_document(self, email_key):
+        with read_primary():
+            version, _ = ResourceVersion.objects.current(
+                ResourceVersion.thread_key(email_key)
+            )
+            return version, self.build(email_key)
+
+    def get(self, email_id, min_version=0):
+        """
+        Returns the serialized live annotations of a thread, each with
+        `comment_count` and `latest_comments`, building the document on a
+        miss, after a write or when it is older than `min_version`.
+        """
+        email_key = normalize_email_id(email_id)
+        if not self.enabled:
+            return self.build(email_key)
+
+        doc_key, version_key = self._keys(email_key)
+        cached = self._cache.get_many([doc_key, version_key])
+        document, version = cached.get(doc_key), cached.get(version_key)
+        token = version["token"] if version else None
+
+        if (
+            document is not None
+            and document.get("version", 0) >= min_version
+            and (
+                document["token"] == token
+                or (version and time.time() - version["at"] <= self.stale_seconds)
+            )
+        ):
+            self.stats.record(True)
+            return document["data"]
+
+        self.stats.record(False)
+        resource_version, data = self.build_document(email_key)
+        self._cache.set(
+            doc_key,
+            {"token": token, "version": resource_version, "data": data},
+            self.timeout,
+        )
+        return data
+
+    def invalidate(self, email_key):
+        _, version_key = self._keys(email_key)
+        # documents built before this point expire within `timeout`, so the
+        # marker does not need to outlive them
+        self._cache.set(
+            version_key, {"token": uuid.uuid4().hex, "at": time.time()}, self.timeout
+        )
+
+    def invalidate_on_commit(self, email_keys, using=None):
+        """
+        Invalidates the documents of `email_keys` once the current transaction
+        commits, or immediately outside a transaction.
+        """
+        if not self.enabled:
+            return
+        email_keys = set(email_keys)
+        transaction.on_commit(
+            lambda: [self.invalidate(email_key) for email_key in email_keys],
+            using=using,
+        )
+
+
+def get_thread_documents():
+    """
+    Returns the process-wide thread document store, built from
+    `settings.THREAD_DOCUMENT` on first use.
+    """
+    global _thread_documents
+    if _thread_documents is None:
+        _thread_documents = ThreadDocumentStore(
+            {"COMMENTS": settings.THREAD_OVERVIEW["COMMENTS"], **settings.THREAD_DOCUMENT}
+        )
+        CACHE_COUNTERS.register("thread_documents", _thread_documents.stats)
+    return _thread_documents
+
+
+def annotation_rows(document):
+    """
+    Projects thread document entries onto the `RetrieveAnnotationSerializer`
+    fields, in the same order.
+    """
+    fields = RetrieveAnnotationSerializer.Meta.fields
+    return [{field: item[field] for field in fields} for item in document]
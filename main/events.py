@@ -0,0 +1,219 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.utils.module_loading import import_string
+
+from main.models import normalize_email_id
+from main.renderers import FastJSONRenderer
+
+_broker = None
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    type: str
+    data: dict
+
+    def encode(self):
+        """Server-sent events wire format."""
+        data = FastJSONRenderer().render(self.data).decode()
+        return f"id: {self.id}\nevent: {self.type}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """
+    One stream consumer. Events are queued on its event loop; when the
+    bounded queue is full the subscription is marked `overflowed` and
+    receives nothing more, so a slow consumer never holds back the
+    publisher or grows memory without bound. It reconnects with its last
+    event id and resumes from the broker's history.
+    """
+
+    def __init__(self, thread, maxsize):
+        self.thread = thread
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def push(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def deliver(self, event):
+        # publishers run on request threads, the queue belongs to the loop
+        self.loop.call_soon_threadsafe(self.push, event)
+
+
+class InMemoryBroker:
+    """
+    Per-process pub/sub for thread change events, keeping the last
+    `history` events of each thread so subscribers can resume after a
+    reconnect. Other brokers (e.g. Redis backed, to fan out across worker
+    processes) only need `publish`, `subscribe` and `unsubscribe`.
+
+    The history of a thread nobody is subscribed to is dropped once no
+    event was published on it for `history_ttl` seconds, or when more than
+    `max_threads` threads have one (least recently published first).
+    Subscribers resuming from a dropped history get a reset event.
+
+    Args:
+        history (int): Events kept per thread for resuming.
+        queue_size (int): Events buffered per subscriber before it is dropped.
+        history_ttl (float): Seconds an idle thread's history is kept.
+        max_threads (int): Threads whose history is kept.
+    """
+
+    def __init__(self, history=500, queue_size=100, history_ttl=3600, max_threads=10000):
+        self.history = history
+        self.queue_size = queue_size
+        self.history_ttl = history_ttl
+        self.max_threads = max_threads
+        self._lock = threading.Lock()
+        # thread -> (event id counter, recent events, last publish time), oldest first
+        self._threads = OrderedDict()
+        self._subscribers = {}
+
+    def _evict(self, now, current):
+        # called with the lock held; subscribed threads go to the back once,
+        # behind `current`, which was just published on and is kept
+        for _ in range(len(self._threads)):
+            thread, (_, _, published_at) = next(iter(self._threads.items()))
+            if thread == current or (
+                len(self._threads) <= self.max_threads
+                and now - published_at < self.history_ttl
+            ):
+                break
+            if thread in self._subscribers:
+                self._threads.move_to_end(thread)
+            else:
+                del self._threads[thread]
+
+    def publish(self, thread, type, data):
+        thread = normalize_email_id(thread)
+        now = time.monotonic()
+        with self._lock:
+            counter, events, _ = self._threads.pop(thread, None) or (
+                itertools.count(1),
+                deque(maxlen=self.history),
+                now,
+            )
+            event = Event(next(counter), type, data)
+            events.append(event)
+            self._threads[thread] = (counter, events, now)
+            self._evict(now, thread)
+            for subscription in self._subscribers.get(thread, ()):
+                subscription.deliver(event)
+        return event
+
+    def subscribe(self, thread, last_event_id=None):
+        """
+        Registers a subscriber on the running event loop.
+
+        Returns:
+            Tuple[Subscription, List[Event], bool]: The subscription, the
+                missed events after `last_event_id`, and whether some were
+                already dropped from history (the client should refetch).
+        """
+        thread = normalize_email_id(thread)
+        subscription = Subscription(thread, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(thread, set()).add(subscription)
+            history = list(self._threads[thread][1]) if thread in self._threads else []
+
+        if last_event_id is None:
+            return subscription, [], False
+        missed = [event for event in history if event.id > last_event_id]
+        if history:
+            # history no longer reaches back, or the counter restarted
+            gap = history[0].id > last_event_id + 1 or history[-1].id < last_event_id
+        else:
+            gap = last_event_id > 0
+        return subscription, missed, gap
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.thread, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.thread, None)
+
+
+def get_broker():
+    """
+    Returns the process-wide broker named by `settings.EVENT_STREAM["BROKER"]`.
+    """
+    global _broker
+    if _broker is None:
+        config = settings.EVENT_STREAM
+        _broker = import_string(config["BROKER"])(
+            history=config["HISTORY"],
+            queue_size=config["QUEUE_SIZE"],
+            history_ttl=config["HISTORY_TTL"],
+            max_threads=config["MAX_THREADS"],
+        )
+    return _broker
+
+
+async def stream_events(thread, last_event_id=None):
+    """
+    Yields a thread's events in server-sent events format: missed events
+    first, then live ones, with comment heartbeats to keep proxies from
+    closing an idle connection. Ends when the subscriber overflows, or
+    after `MAX_DURATION` seconds, since Django does not notice clients that
+    went away; the client reconnects with its last event id.
+    """
+    config = settings.EVENT_STREAM
+    broker = get_broker()
+    subscription, missed, gap = broker.subscribe(thread, last_event_id)
+    ends_at = time.monotonic() + config["MAX_DURATION"]
+    try:
+        yield f"retry: {config['RETRY_MS']}\n\n"
+        if gap:
+            yield "event: reset\ndata: {}\n\n"
+        for event in missed:
+            yield event.encode()
+        while (remaining := ends_at - time.monotonic()) > 0:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=min(config["HEARTBEAT"], remaining)
+                )
+            except asyncio.TimeoutError:
+                if subscription.overflowed:
+                    break
+                if remaining > config["HEARTBEAT"]:
+                    yield ": keep-alive\n\n"
+                continue
+            if subscription.overflowed:
+                # reconnecting with the last delivered id replays the rest
+                yield "event: overflow\ndata: {}\n\n"
+                break
+            yield event.encode()
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def publish_on_commit(thread, type, data, using=None):
+    """Publishes an event once the current transaction commits."""
+    if settings.EVENT_STREAM["ENABLED"]:
+        transaction.on_commit(
+            lambda: get_broker().publish(thread, type, data), using=using
+        )
+
+
+def change_type(kind, signal, created=False, is_deleted=False):
+    """`<kind>.created`, `<kind>.updated` or `<kind>.deleted` for a model signal."""
+    if signal is post_delete or is_deleted:
+        return f"{kind}.deleted"
+    return f"{kind}.created" if created else f"{kind}.updated"
@@ -0,0 +1,48 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F
+from rest_framework.filters import SearchFilter
+
+# characters with a meaning in to_tsquery syntax are dropped from search terms
+_TSQUERY_UNSAFE = re.compile(r"[^\w@.+-]+")
+
+
+class AnnotationSearchFilter(SearchFilter):
+    """
+    Keeps the `?search=` contract of `SearchFilter`, but on Postgres matches
+    against the indexed, weighted `Annotation.search_vector` instead of
+    ILIKE over every search field. Each term is prefix-matched (`term:*`),
+    all terms must match, and results are ordered by rank. Other database
+    backends fall back to the regular `SearchFilter` behaviour.
+    """
+
+    def get_search_query(self, terms):
+        query = None
+        for term in terms:
+            term = _TSQUERY_UNSAFE.sub("", term).strip(".+-")
+            if not term:
+                continue
+            # english matches stemmed text, simple matches labels and emails verbatim
+            term_query = SearchQuery(
+                f"{term}:*", search_type="raw", config="english"
+            ) | SearchQuery(f"{term}:*", search_type="raw", config="simple")
+            query = term_query if query is None else query & term_query
+        return query
+
+    def filter_queryset(self, request, queryset, view):
+        if connections[queryset.db].vendor != "postgresql":
+            return super().filter_queryset(request, queryset, view)
+
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        if (query := self.get_search_query(terms)) is None:
+            return queryset.none()
+
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(search_rank=SearchRank(F("search_vector"), query))
+            .order_by("-search_rank", "-created_at")
+        )
@@ -1,9 +1,23 @@
 import ast
-import os, requests
+import asyncio
+import contextvars
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
 import openai
+from django.conf import settings
+from django.db import connections
 from dotenv import load_dotenv
 import logging
 
+from main.cache import build_cache
+from main.classifier import classify_text, to_annotations
+from main.metrics import CACHE_COUNTERS, timed
+from main.nylas_client import AsyncNylasClient, NylasClient
+from main.suggestion_cache import SuggestionCache
+
 load_dotenv()
 base_url = os.getenv("NYLAS_BASE_URL")
 auth = os.getenv("NLYAS_AUTH")
@@ -11,8 +25,74 @@ logger = logging.getLogger("server_log")
 
 openai.api_key = os.getenv("OPEN_AI_TOKEN")
 
+_participant_cache = None
+_suggestion_cache = None
+_nylas_client = None
+_async_nylas_clients = weakref.WeakKeyDictionary()
+_llm_slots = None
+_llm_slots_lock = threading.Lock()
+
+
+class UnknownEmailError(ValueError):
+    """Raised when Nylas reports that an email id does not exist."""
+
+
+def get_participant_cache():
+    """
+    Returns the process-wide cache of thread participants, building it from
+    `settings.PARTICIPANT_CACHE` on first use.
+    """
+    global _participant_cache
+    if _participant_cache is None:
+        _participant_cache = build_cache(
+            settings.PARTICIPANT_CACHE, prefix="participants:"
+        )
+        CACHE_COUNTERS.register("participants", _participant_cache.stats)
+    return _participant_cache
+
+
+def get_nylas_client():
+    """
+    Returns the process-wide Nylas client so every call reuses its pooled
+    keep-alive connections. Options come from `settings.NYLAS_CLIENT`.
+    """
+    global _nylas_client
+    if _nylas_client is None:
+        _nylas_client = NylasClient(base_url, auth, **settings.NYLAS_CLIENT)
+    return _nylas_client
+
+
+def get_async_nylas_client():
+    """
+    Returns the async Nylas client bound to the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_nylas_clients:
+        _async_nylas_clients[loop] = AsyncNylasClient(
+            base_url, auth, **settings.NYLAS_CLIENT
+        )
+    return _async_nylas_clients[loop]
+
+
+def get_suggestion_cache():
+    """
+    Returns the process-wide cache of auto-annotation results, built from
+    `settings.ANNOTATION_CACHE` on first use.
+    """
+    global _suggestion_cache
+    if _suggestion_cache is None:
+        _suggestion_cache = SuggestionCache(settings.ANNOTATION_CACHE)
+        CACHE_COUNTERS.register(
+            "annotation_suggestions", _suggestion_cache.memory.stats
+        )
+        CACHE_COUNTERS.register(
+            "annotation_suggestions_db", _suggestion_cache.db_stats
+        )
+    return _suggestion_cache
+
 
 # confirm email id
+@timed("nylas")
 def confirm_email_and_participants(email_id):
     """
     Confirms the provided email ID by calling Nylas messages API
@@ -22,36 +102,121 @@ def confirm_email_and_participants(email_id):
         email_id (str): The email ID to confirm.
 
     Returns:
-        None
+        List[str]: A list of email participants.
 
     Raises:
         ValueError: If the email ID is not provided, or if there is an error confirming the email ID.
 
+    Participants are cached for `PARTICIPANT_CACHE["TIMEOUT"]` seconds and
+    ids Nylas does not know for `PARTICIPANT_CACHE["NEGATIVE_TIMEOUT"]`.
     """
 
     if not email_id:
         raise ValueError("Email id must be provided")
 
-    header = {
-        "Accept": "application/json",
-        "Authorization": f"Bearer {auth}",
-        "Content-Type": "application/json",
-    }
-    url = f"{base_url}/messages/{email_id}"
+    cache = get_participant_cache()
+    if (cached := _from_cache(cache.get(email_id))) is not None:
+        return cached
 
     try:
-        return _confirm_email_extract(url, header, email_id)
+        email_participants = _confirm_email_extract(email_id)
+    except UnknownEmailError as ex:
+        logger.error("Error confirming email id: %s", ex)
+        cache.set(
+            email_id,
+            (False, ex.args[0]),
+            timeout=settings.PARTICIPANT_CACHE["NEGATIVE_TIMEOUT"],
+        )
+        raise
     except Exception as ex:
         logger.error("Error confirming email id: %s", ex)
         raise ValueError(ex.args[0] or "An error occurred confirming email") from ex
 
+    cache.set(email_id, (True, email_participants))
+    return list(email_participants)
+
+
+@timed("nylas")
+async def aconfirm_email_and_participants(email_id):
+    """
+    Async variant of `confirm_email_and_participants` that awaits the Nylas
+    call instead of blocking the worker thread. Shares the participant cache.
+    """
+
+    if not email_id:
+        raise ValueError("Email id must be provided")
+
+    cache = get_participant_cache()
+    if (cached := _from_cache(await cache.aget(email_id))) is not None:
+        return cached
 
-def _confirm_email_extract(url, header, email_id):
+    try:
+        status_code, res_json = await get_async_nylas_client().get_message(email_id)
+        email_participants = _extract_participants(status_code, res_json, email_id)
+    except UnknownEmailError as ex:
+        logger.error("Error confirming email id: %s", ex)
+        await cache.aset(
+            email_id,
+            (False, ex.args[0]),
+            timeout=settings.PARTICIPANT_CACHE["NEGATIVE_TIMEOUT"],
+        )
+        raise
+    except Exception as ex:
+        logger.error("Error confirming email id: %s", ex)
+        raise ValueError(
+            (ex.args and ex.args[0]) or "An error occurred confirming email"
+        ) from ex
+
+    await cache.aset(email_id, (True, email_participants))
+    return list(email_participants)
+
+
+def refresh_participants(email_id, participants=None, timeout=None):
+    """
+    Stores the current participants of `email_id` in the participant cache,
+    fetching them from Nylas unless they are given. Used to pre-warm the
+    cache from webhook notifications, off the request path.
+
+    Args:
+        email_id (str): The Nylas message id.
+        participants (List[str]): Participants already known, e.g. from the
+            notification payload.
+        timeout (int): Cache lifetime, defaults to `PARTICIPANT_CACHE["TIMEOUT"]`.
+
+    Returns:
+        List[str]: The participants, or None if Nylas does not know the id.
+    """
+    cache = get_participant_cache()
+    if participants is None:
+        try:
+            participants = _confirm_email_extract(email_id)
+        except UnknownEmailError as ex:
+            cache.set(
+                email_id,
+                (False, ex.args[0]),
+                timeout=settings.PARTICIPANT_CACHE["NEGATIVE_TIMEOUT"],
+            )
+            return None
+
+    cache.set(email_id, (True, participants), timeout=timeout)
+    return list(participants)
+
+
+def _from_cache(cached):
+    if cached is None:
+        return None
+    found, value = cached
+    if not found:
+        raise UnknownEmailError(value)
+    return list(value)
+
+
+def _confirm_email_extract(email_id):
     """
     The method retrieves the email participants from the JSON object and returns them as a list.
 
     Args:
-        json_obj: The JSON object containing the email details.
+        email_id (str): The email ID to fetch from Nylas.
 
     Returns:
         List[str]: A list of email participants.
@@ -60,13 +225,18 @@ def _confirm_email_extract(url, header, email_id):
         ValueError: Raised when the email confirmation fails or the email participants cannot be retrieved.
 
     """
-    res = requests.get(url, headers=header, timeout=(60, 90))
-    res_json = res.json()
-    if res.status_code != 200 or "message" in res_json:
+    res = get_nylas_client().get_message(email_id)
+    return _extract_participants(res.status_code, res.json(), email_id)
+
+
+def _extract_participants(status_code, res_json, email_id):
+    if status_code == 404:
+        raise UnknownEmailError(res_json.get("message") or "Unable to confirm email id")
+    if status_code != 200 or "message" in res_json:
         raise ValueError(res_json.get("message") or "Unable to confirm email id")
 
     if email_id != res_json.get("id"):
-        raise ValueError("Unable to confirm email id")
+        raise UnknownEmailError("Unable to confirm email id")
 
     if email_participants := confirm_email_participant(res_json):
         return email_participants
@@ -82,41 +252,221 @@ def confirm_email_participant(json_obj):
     return email_list
 
 
-def auto_create_annotation(text):
+ANNOTATION_ENGINE = "text-davinci-003"
+# bump whenever the prompt changes so cached results are not reused
+ANNOTATION_PROMPT_VERSION = "1"
+ANNOTATION_ERROR = "Error generating annotation"
+
+
+def _annotation_prompt(text):
     if not text:
         raise ValueError("Please provide a text to create an annotation")
 
     if len(text) > 300:
         raise ValueError("Text cannot exceed 300 characters")
 
-    prompt = f"Given the user input '{text}', categorize the text under one or more of the following labels:\n- Task\n- Meeting Request\n- Follow-up\n- Question\n- Deadline\n- Approval\n- Feedback\n- Review. Ensure the response returns a python dictionary with the format 'Category: <label>, Annotation: <selected_text>', with no additional text."
+    return f"Given the user input '{text}', categorize the text under one or more of the following labels:\n- Task\n- Meeting Request\n- Follow-up\n- Question\n- Deadline\n- Approval\n- Feedback\n- Review. Ensure the response returns a python dictionary with the format 'Category: <label>, Annotation: <selected_text>', with no additional text."
+
+
+def _parse_annotation_response(response):
+    res = response.choices[0].text.strip().replace("\n", "").split(";")
+    logger.debug("Annotation response: %s", res)
+    resp = []
+
+    for val in res:
+        if "Category" not in val:
+            new_val = val.split(":")
+            resp.append({"Category": new_val[0], "Annotation": new_val[1]})
+        elif isinstance(val, str):
+            response_dict = ast.literal_eval(val)
+            if isinstance(response_dict, dict):
+                resp.append(response_dict)
+            else:
+                for vv in response_dict:
+                    resp.append(vv)
+
+        else:
+            resp = res
+
+    return resp
+
+
+def _classify(text):
+    """
+    Runs the local rule-based classifier. Returns the annotations when the LLM
+    can be skipped, plus every match for use as a fallback.
+
+    The LLM is only skipped when every matched label is confident; a label
+    scoring between MIN_CONFIDENCE and THRESHOLD would otherwise be dropped.
+    """
+    config = settings.ANNOTATION_CLASSIFIER
+    if not config["ENABLED"]:
+        return None, None
+
+    results = classify_text(text, min_confidence=config["MIN_CONFIDENCE"])
+    if all(r["confidence"] >= config["THRESHOLD"] for r in results):
+        confident = results
+    else:
+        confident = []
+    return to_annotations(confident) or None, to_annotations(results) or None
+
+
+@timed("openai")
+def auto_create_annotation(text):
+    prompt = _annotation_prompt(text)
+    confident, fallback = _classify(text)
+    if confident:
+        return confident
+
+    cache = get_suggestion_cache()
+    key = cache.make_key(text, ANNOTATION_PROMPT_VERSION, ANNOTATION_ENGINE)
+    if (cached := cache.get(key)) is not None:
+        return cached
 
     try:
         response = openai.Completion.create(
-            engine="text-davinci-003", prompt=prompt, max_tokens=200
+            engine=ANNOTATION_ENGINE, prompt=prompt, max_tokens=200
         )
+        resp = _parse_annotation_response(response)
 
-        res = response.choices[0].text.strip().replace("\n", "").split(";")
-        print(res)
-        resp = []
-
-        for val in res:
-            if "Category" not in val:
-                new_val = val.split(":")
-                resp.append({"Category": new_val[0], "Annotation": new_val[1]})
-            elif isinstance(val, str):
-                response_dict = ast.literal_eval(val)
-                if isinstance(response_dict, dict):
-                    resp.append(response_dict)
-                else:
-                    for vv in response_dict:
-                        resp.append(vv)
+    except Exception as ex:
+        logger.error("Error generating annotation for text:%s,  %s", text, ex)
+        return fallback or ANNOTATION_ERROR
+
+    cache.set(key, resp, ANNOTATION_PROMPT_VERSION, ANNOTATION_ENGINE)
+    return resp
 
-            else:
-                resp = res
 
-        return resp
+@timed("openai")
+async def aauto_create_annotation(text):
+    """
+    Async variant of `auto_create_annotation` that awaits the OpenAI call.
+    """
+    prompt = _annotation_prompt(text)
+    confident, fallback = _classify(text)
+    if confident:
+        return confident
+
+    cache = get_suggestion_cache()
+    key = cache.make_key(text, ANNOTATION_PROMPT_VERSION, ANNOTATION_ENGINE)
+    if (cached := await cache.aget(key)) is not None:
+        return cached
+
+    try:
+        response = await openai.Completion.acreate(
+            engine=ANNOTATION_ENGINE, prompt=prompt, max_tokens=200
+        )
+        resp = _parse_annotation_response(response)
 
     except Exception as ex:
         logger.error("Error generating annotation for text:%s,  %s", text, ex)
-        return "Error generating annotation"
+        return fallback or ANNOTATION_ERROR
+
+    await cache.aset(key, resp, ANNOTATION_PROMPT_VERSION, ANNOTATION_ENGINE)
+    return resp
+
+
+def _batch_result(future):
+    try:
+        data = future.result()
+    except Exception as ex:
+        return {"status": "failed", "message": str(ex) or type(ex).__name__}
+    if data == ANNOTATION_ERROR:
+        return {"status": "failed", "message": data}
+    return {"status": "success", "data": data}
+
+
+def _get_llm_slots():
+    """
+    Returns the process-wide semaphore capping LLM calls run by batches,
+    including ones still finishing after their batch timed out.
+    """
+    global _llm_slots
+    with _llm_slots_lock:
+        if _llm_slots is None:
+            _llm_slots = threading.BoundedSemaphore(
+                settings.AUTO_ANNOTATION_BATCH["MAX_IN_FLIGHT"]
+            )
+    return _llm_slots
+
+
+def _batch_annotation(text, expires_at):
+    slots = _get_llm_slots()
+    if not slots.acquire(timeout=max(expires_at - time.monotonic(), 0)):
+        raise TimeoutError("Timed out")
+    try:
+        return auto_create_annotation(text)
+    finally:
+        slots.release()
+        # worker threads are discarded with the executor, so are their connections
+        connections.close_all()
+
+
+def auto_create_annotations(texts, concurrency=None, deadline=None):
+    """
+    Annotates several texts, running at most `concurrency` LLM calls at a time.
+
+    Args:
+        texts (List[str]): Texts to annotate, each at most 300 characters.
+        concurrency (int): Maximum number of concurrent LLM calls.
+        deadline (float): Seconds allowed for the whole batch. Texts still
+            pending when it expires are reported as timed out.
+
+    Returns:
+        List[dict]: One result per text, in input order, with a "status" of
+            "success" (and "data") or "failed" (and "message").
+    """
+    config = settings.AUTO_ANNOTATION_BATCH
+    concurrency = concurrency or config["CONCURRENCY"]
+    deadline = deadline or config["DEADLINE"]
+
+    expires_at = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(texts) or 1))
+    try:
+        # each call runs in a copy of the request context so its time is recorded
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, _batch_annotation, text, expires_at
+            )
+            for text in texts
+        ]
+        wait(futures, timeout=deadline)
+    finally:
+        # calls still running past the deadline finish in the background, where
+        # they keep holding one of the MAX_IN_FLIGHT slots until they return
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return [
+        {"index": index, **_batch_result(future)}
+        if future.done() and not future.cancelled()
+        else {"index": index, "status": "failed", "message": "Timed out"}
+        for index, future in enumerate(futures)
+    ]
+
+
+async def aauto_create_annotations(texts, concurrency=None, deadline=None):
+    """
+    Async variant of `auto_create_annotations`; pending calls are cancelled
+    when the deadline expires.
+    """
+    config = settings.AUTO_ANNOTATION_BATCH
+    semaphore = asyncio.Semaphore(concurrency or config["CONCURRENCY"])
+
+    async def annotate(text):
+        async with semaphore:
+            return await aauto_create_annotation(text)
+
+    tasks = [asyncio.ensure_future(annotate(text)) for text in texts]
+    if tasks:
+        await asyncio.wait(tasks, timeout=deadline or config["DEADLINE"])
+    for task in tasks:
+        task.cancel()
+    # let cancelled calls close their connections before returning
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return [
+        {"index": index, **_batch_result(task)}
+        if task.done() and not task.cancelled()
+        else {"index": index, "status": "failed", "message": "Timed out"}
+        for index, task in enumerate(tasks)
+    ]
@@ -0,0 +1,124 @@
+"""
+Logging building blocks referenced from `settings.LOGGING`. Kept free of
+Django imports, since logging is configured before the apps are loaded.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRIBUTES = set(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None))
+) | {"message", "asctime"}
+_exception_formatter = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line, with the fields passed
+    through `extra=` kept as top-level keys.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of DEBUG records, per logger name; INFO and above
+    always pass.
+
+    Args:
+        rates (dict): Logger name to the fraction (0-1) of its DEBUG records
+            kept. Child loggers use the rate of their closest configured parent.
+        default (float): Rate of loggers not listed in `rates`.
+    """
+
+    def __init__(self, rates=None, default=1.0):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.default = default
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return self.default
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    Hands records to a bounded queue that a background `QueueListener`
+    drains into the real handlers, so the request thread never waits on
+    disk or console I/O. When the queue is full the record is dropped and
+    counted in `dropped` rather than blocking the caller.
+
+    Args:
+        handlers (list): Target handlers. In `LOGGING` pass them as
+            "cfg://handlers.<name>"; dictConfig creates handlers in name
+            order, so this handler's name must sort after its targets.
+        queue_size (int): Records buffered before new ones are dropped.
+    """
+
+    def __init__(self, handlers, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        # dictConfig hands over a ConvertingList, which resolves the
+        # cfg:// references on item access only
+        targets = [handlers[index] for index in range(len(handlers))]
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, *targets, respect_handler_level=True)
+        self.listener.start()
+        self.running = True
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Flushes the queued records and stops the listener thread."""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+    def prepare(self, record):
+        # merge args now, since they may change before the listener runs,
+        # but keep the traceback separate from the message for JSONFormatter
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
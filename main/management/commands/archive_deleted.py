@@ -0,0 +1,176 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from main.models import (
+    Annotation,
+    AnnotationComment,
+    ArchivedAnnotation,
+    ArchivedAnnotationComment,
+    ResourceVersion,
+)
+
+ANNOTATION_FIELDS = [
+    "id",
+    "email_id",
+    "email_key",
+    "text",
+    "position",
+    "user_email",
+    "annotation_label",
+    "created_at",
+    "updated_at",
+    "is_deleted",
+]
+COMMENT_FIELDS = [
+    "id",
+    "comment",
+    "author_email",
+    "annotation_id",
+    "created_at",
+    "updated_at",
+    "is_deleted",
+]
+
+
+def delete_rows(model, pks, using):
+    """
+    Deletes rows by primary key with one statement. Archived rows are
+    already invisible, so the per-row signals and cascade collection of
+    `QuerySet.delete()` are skipped on purpose.
+    """
+    if not pks:
+        return 0
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ", ".join(["%s"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", pks)
+        return cursor.rowcount
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves soft-deleted annotations and comments older than the retention "
+        "window into the archive tables, in small throttled batches"
+    )
+
+    def add_arguments(self, parser):
+        config = settings.ARCHIVE
+        parser.add_argument(
+            "--retention-days", type=float, default=config["RETENTION_DAYS"]
+        )
+        parser.add_argument("--batch-size", type=int, default=config["BATCH_SIZE"])
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=config["SLEEP"],
+            help="seconds to pause between batches",
+        )
+        parser.add_argument(
+            "--max-batches", type=int, default=None, help="stop after this many batches"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="only count what would be archived"
+        )
+
+    def handle(self, *args, **options):
+        self.using = router.db_for_write(Annotation)
+        self.batch_size = options["batch_size"]
+        cutoff = timezone.now() - timedelta(days=options["retention_days"])
+
+        # updated_at is set by the soft delete itself
+        annotations = Annotation.objects.filter(is_deleted=True, updated_at__lt=cutoff)
+        comments = AnnotationComment.objects.filter(
+            is_deleted=True, updated_at__lt=cutoff, annotation__is_deleted=False
+        )
+        if options["dry_run"]:
+            self.stdout.write(
+                f"{annotations.count()} annotations and {comments.count()} "
+                f"comments deleted before {cutoff:%Y-%m-%d %H:%M} would be archived"
+            )
+            return
+
+        totals = {"annotations": 0, "comments": 0}
+        batches = 0
+        for archive_batch, queryset in [
+            (self.archive_annotations, annotations),
+            (self.archive_comments, comments),
+        ]:
+            while options["max_batches"] is None or batches < options["max_batches"]:
+                archived = archive_batch(queryset)
+                if not any(archived.values()):
+                    break
+                batches += 1
+                for name, count in archived.items():
+                    totals[name] += count
+                # let other writers through between batches
+                time.sleep(options["sleep"])
+
+        self.stdout.write(
+            f"Archived {totals['annotations']} annotations and "
+            f"{totals['comments']} comments in {batches} batches"
+        )
+
+    def lock_batch(self, queryset):
+        # rows another transaction is touching are left for the next run
+        return list(
+            queryset.using(self.using)
+            .select_for_update(skip_locked=True, of=("self",))
+            .order_by("updated_at")
+            .values_list("pk", flat=True)[: self.batch_size]
+        )
+
+    def archive_annotations(self, queryset):
+        with transaction.atomic(using=self.using):
+            pks = self.lock_batch(queryset)
+            if not pks:
+                return {"annotations": 0, "comments": 0}
+            # comments go with their annotation, deleted or not
+            comments = list(
+                AnnotationComment.objects.using(self.using)
+                .filter(annotation_id__in=pks)
+                .values(*COMMENT_FIELDS)
+            )
+            ArchivedAnnotationComment.objects.using(self.using).bulk_create(
+                [ArchivedAnnotationComment(**row) for row in comments],
+            )
+            delete_rows(AnnotationComment, [row["id"] for row in comments], self.using)
+
+            rows = Annotation.objects.using(self.using).filter(pk__in=pks)
+            ArchivedAnnotation.objects.using(self.using).bulk_create(
+                [ArchivedAnnotation(**row) for row in rows.values(*ANNOTATION_FIELDS)],
+            )
+            # their ResourceVersion rows stay, so versions never start over
+            # and an ETag from before the archive cannot match again
+            delete_rows(Annotation, pks, self.using)
+            self.bump_annotations(pks)
+        return {"annotations": len(pks), "comments": len(comments)}
+
+    def archive_comments(self, queryset):
+        with transaction.atomic(using=self.using):
+            pks = self.lock_batch(queryset)
+            rows = list(
+                AnnotationComment.objects.using(self.using)
+                .filter(pk__in=pks)
+                .values(*COMMENT_FIELDS)
+            )
+            ArchivedAnnotationComment.objects.using(self.using).bulk_create(
+                [ArchivedAnnotationComment(**row) for row in rows],
+            )
+            delete_rows(AnnotationComment, pks, self.using)
+            # soft-deleted comments are still listed, so the lists change
+            self.bump_annotations({row["annotation_id"] for row in rows})
+        return {"annotations": 0, "comments": len(pks)}
+
+    def bump_annotations(self, annotation_ids):
+        if annotation_ids:
+            ResourceVersion.objects.bump(
+                [ResourceVersion.annotation_key(pk) for pk in annotation_ids],
+                using=self.using,
+            )
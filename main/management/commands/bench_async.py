@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import openai
+from aiohttp import web
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment
+
+from main import helper
+from main.views import AsyncAutoCreateAnnotationView, AutoCreateAnnotationView
+
+
+def start_stub_upstream(delay):
+    """
+    Starts a local aiohttp server in a background thread that imitates the
+    Nylas messages API and the OpenAI completions API, answering every
+    request after `delay` seconds. Returns the server base url.
+    """
+
+    async def message(request):
+        await asyncio.sleep(delay)
+        return web.json_response(
+            {
+                "id": request.match_info["message_id"],
+                "from": [{"email": "sender@example.com"}],
+                "to": [{"email": "receiver@example.com"}],
+            }
+        )
+
+    async def completion(request):
+        await asyncio.sleep(delay)
+        return web.json_response(
+            {
+                "object": "text_completion",
+                "choices": [
+                    {"text": "{'Category': 'Task', 'Annotation': 'review it'}"}
+                ],
+            }
+        )
+
+    app = web.Application()
+    app.router.add_get("/messages/{message_id}", message)
+    app.router.add_post("/v1/engines/{engine}/completions", completion)
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares WSGI (thread per request) and ASGI (one event loop) throughput "
+        "of the upstream-bound annotation paths against slow local stubs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument(
+            "--workers", type=int, default=8, help="WSGI worker threads"
+        )
+        parser.add_argument(
+            "--delay", type=float, default=0.2, help="Upstream latency in seconds"
+        )
+
+    def handle(self, *args, **options):
+        total = options["requests"]
+        workers = options["workers"]
+        stub_url = start_stub_upstream(options["delay"])
+        setup_test_environment()
+
+        url = "/api/threads/annotation/"
+        async_url = "/api/async/threads/annotation/"
+
+        # every call must reach the stub LLM: the local classifier is off and
+        # each text is unique, so the suggestion cache never answers
+        def payload(prefix, i):
+            return {"text": f"Benchmark note {prefix}-{time.time()}-{i}"}
+
+        with mock.patch.object(helper, "base_url", stub_url), mock.patch.object(
+            openai, "api_base", f"{stub_url}/v1"
+        ), mock.patch.object(
+            AutoCreateAnnotationView, "throttle_classes", []
+        ), mock.patch.object(
+            AsyncAutoCreateAnnotationView, "throttle_classes", []
+        ), override_settings(
+            ANNOTATION_CLASSIFIER={
+                **settings.ANNOTATION_CLASSIFIER,
+                "ENABLED": False,
+            }
+        ):
+
+            def sync_view(i):
+                return Client().post(
+                    url, payload("sync", i), content_type="application/json"
+                )
+
+            async def async_views():
+                client = AsyncClient()
+                return await asyncio.gather(
+                    *(
+                        client.post(
+                            async_url,
+                            payload("async", i),
+                            content_type="application/json",
+                        )
+                        for i in range(total)
+                    )
+                )
+
+            self.report(
+                "auto-annotate view",
+                total,
+                workers,
+                lambda: self.run_threads(sync_view, total, workers),
+                lambda: asyncio.run(async_views()),
+            )
+
+            # unique ids so every lookup misses the participant cache
+            def sync_lookup(i):
+                return helper.confirm_email_and_participants(f"sync-{time.time()}-{i}")
+
+            async def async_lookups():
+                try:
+                    return await asyncio.gather(
+                        *(
+                            helper.aconfirm_email_and_participants(
+                                f"async-{time.time()}-{i}"
+                            )
+                            for i in range(total)
+                        )
+                    )
+                finally:
+                    await helper.get_async_nylas_client().close()
+
+            self.report(
+                "participant lookup",
+                total,
+                workers,
+                lambda: self.run_threads(sync_lookup, total, workers),
+                lambda: asyncio.run(async_lookups()),
+            )
+
+    def run_threads(self, func, total, workers):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(func, range(total)))
+
+    def report(self, name, total, workers, run_sync, run_async):
+        started = time.perf_counter()
+        run_sync()
+        sync_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        run_async()
+        async_elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{name}: WSGI ({workers} threads) {total / sync_elapsed:.1f} req/s, "
+            f"ASGI (1 loop) {total / async_elapsed:.1f} req/s"
+        )
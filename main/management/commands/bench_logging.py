@@ -0,0 +1,100 @@
+import logging
+import os
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+from django.core.management.base import BaseCommand
+
+from main.log import BackgroundQueueHandler, JSONFormatter, SamplingFilter
+
+VERBOSE = logging.Formatter(
+    "[%(asctime)s] %(levelname)s [%(name)s:%(lineno)s] %(message)s",
+    datefmt="%d/%b/%Y %H:%M:%S",
+)
+
+
+def legacy_logger(directory, console):
+    """The previous setup: console plus three files, all on the calling thread."""
+    logger = logging.getLogger("bench_logging.legacy")
+    handlers = [
+        (logging.StreamHandler(console), logging.DEBUG),
+        (logging.FileHandler(os.path.join(directory, "error.log")), logging.ERROR),
+        (logging.FileHandler(os.path.join(directory, "info.log")), logging.INFO),
+        (logging.FileHandler(os.path.join(directory, "debug.log")), logging.DEBUG),
+    ]
+    for handler, level in handlers:
+        handler.setLevel(level)
+        handler.setFormatter(VERBOSE)
+        logger.addHandler(handler)
+    return logger
+
+
+def queued_logger(directory, console, sample_rate):
+    """The current setup: bounded queue, background listener, JSON, rotation."""
+    logger = logging.getLogger(f"bench_logging.queued.{sample_rate}")
+    console_handler = logging.StreamHandler(console)
+    console_handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    targets = [console_handler]
+    for name, level in [("error.log", logging.ERROR), ("server.log", logging.DEBUG)]:
+        handler = RotatingFileHandler(
+            os.path.join(directory, f"{sample_rate}-{name}"),
+            maxBytes=10 * 1024 * 1024,
+            backupCount=2,
+        )
+        handler.setLevel(level)
+        handler.setFormatter(JSONFormatter())
+        targets.append(handler)
+    handler = BackgroundQueueHandler(targets, queue_size=100000)
+    handler.addFilter(SamplingFilter({logger.name: sample_rate}))
+    logger.addHandler(handler)
+    return logger, handler
+
+
+class Command(BaseCommand):
+    help = "Measures per-request logging overhead on the calling thread"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument(
+            "--debug-records", type=int, default=5, help="DEBUG records per request"
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory, open(
+            os.devnull, "w"
+        ) as console:
+            legacy = legacy_logger(directory, console)
+            legacy.setLevel(logging.DEBUG)
+            legacy.propagate = False
+            self.report("sync handlers (previous)", legacy, options)
+
+            for sample_rate in (1.0, 0.1):
+                logger, handler = queued_logger(directory, console, sample_rate)
+                logger.setLevel(logging.DEBUG)
+                logger.propagate = False
+                self.report(
+                    f"queue + JSON, debug sampled at {sample_rate:g}",
+                    logger,
+                    options,
+                    handler,
+                )
+
+    def report(self, name, logger, options, handler=None):
+        started = time.perf_counter()
+        for request in range(options["requests"]):
+            for step in range(options["debug_records"]):
+                logger.debug("Step %s of request %s", step, request)
+            logger.info("Handled request %s for thread %s", request, "thread-id")
+        elapsed = time.perf_counter() - started
+
+        drained = ""
+        if handler is not None:
+            handler.stop()  # waits for the background thread to catch up
+            drained = f", drained after {time.perf_counter() - started:.2f}s"
+            if handler.dropped:
+                drained += f", {handler.dropped} dropped"
+        self.stdout.write(
+            f"{name}: {elapsed / options['requests'] * 1e6:.1f} us/request on the "
+            f"request thread{drained}"
+        )
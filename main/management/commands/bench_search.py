@@ -0,0 +1,94 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.filters import SearchFilter
+from rest_framework.request import Request
+
+from main.filters import AnnotationSearchFilter
+from main.models import Annotation
+from main.views import RetrieveAnnotationView
+
+WORDS = [
+    "review", "budget", "meeting", "deadline", "approve", "proposal", "draft",
+    "invoice", "schedule", "contract", "feedback", "slides", "report", "launch",
+    "hiring", "roadmap", "design", "release", "customer", "renewal",
+]
+
+SEED_SQL = """
+INSERT INTO main_annotation (
+    id, email_id, email_key, text, position, user_email, annotation_label,
+    created_at, updated_at, is_deleted
+)
+SELECT
+    'bn' || g,
+    'bench-' || (g %% %(threads)s),
+    'bench-' || (g %% %(threads)s),
+    w[1 + g %% 20] || ' the ' || w[1 + (g / 20) %% 20] || ' before the '
+        || w[1 + (g / 400) %% 20] || ' call',
+    'p' || (g %% 300),
+    'user' || g || '@example.com',
+    (ARRAY['task', 'meeting_request', 'follow-up', 'question', 'deadline',
+           'approval', 'feedback', 'review'])[1 + g %% 8],
+    now() - g * interval '1 second',
+    now(),
+    g %% 10 = 0
+FROM generate_series(1, %(rows)s) AS g, (SELECT %(words)s::text[] AS w) AS words
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds annotations inside a rolled-back transaction and compares the "
+        "ILIKE SearchFilter with the full-text AnnotationSearchFilter (Postgres only)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--threads", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--search", default="budg review")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Full-text search benchmarks need Postgres")
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    SEED_SQL,
+                    {
+                        "rows": options["rows"],
+                        "threads": options["threads"],
+                        "words": WORDS,
+                    },
+                )
+                cursor.execute("ANALYZE main_annotation")
+            self.stdout.write(
+                f"seeded {options['rows']} annotations in {time.perf_counter() - started:.1f}s"
+            )
+
+            request = Request(RequestFactory().get("/", {"search": options["search"]}))
+            view = RetrieveAnnotationView()
+            base = Annotation.objects.for_thread("bench-1").filter(is_deleted=False)
+
+            for name, backend in [
+                ("ILIKE SearchFilter", SearchFilter()),
+                ("full-text AnnotationSearchFilter", AnnotationSearchFilter()),
+            ]:
+                queryset = backend.filter_queryset(request, base, view)[:15]
+                self.run(name, queryset, options["repeat"])
+
+            transaction.set_rollback(True)
+
+    def run(self, name, queryset, repeat):
+        list(queryset)  # warm up
+        started = time.perf_counter()
+        for _ in range(repeat):
+            rows = list(queryset)
+        elapsed = (time.perf_counter() - started) / repeat * 1000
+
+        self.stdout.write(f"{name}: {elapsed:.1f} ms/query, {len(rows)} rows")
+        self.stdout.write(queryset.explain(analyze=True))
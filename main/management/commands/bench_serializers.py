@@ -0,0 +1,106 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from main.models import Annotation, AnnotationComment
+from main.renderers import FastJSONRenderer
+from main.serializer import (
+    AnnotationCommentSerializer,
+    AnnotationCommentValuesSerializer,
+    AnnotationValuesSerializer,
+    RetrieveAnnotationSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares ModelSerializer + JSONRenderer with the values() fast path + "
+        "FastJSONRenderer on seeded rows (rolled back afterwards)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with transaction.atomic():
+            annotations = Annotation.objects.bulk_create(
+                Annotation(
+                    email_id="bench-serializers",
+                    text=f"Please review the draft — part {i} “quoted”",
+                    position=f"p{i}",
+                    user_email=f"user{i}@example.com",
+                    annotation_label="review",
+                )
+                for i in range(rows)
+            )
+            AnnotationComment.objects.bulk_create(
+                AnnotationComment(
+                    annotation=annotations[i % len(annotations)],
+                    comment=f"comment {i}",
+                    author_email=f"user{i}@example.com",
+                )
+                for i in range(rows)
+            )
+
+            cases = [
+                (
+                    "annotations",
+                    Annotation.objects.for_thread("bench-serializers"),
+                    RetrieveAnnotationSerializer,
+                    AnnotationValuesSerializer,
+                ),
+                (
+                    "comments",
+                    AnnotationComment.objects.filter(
+                        annotation__email_key="bench-serializers"
+                    ),
+                    AnnotationCommentSerializer,
+                    AnnotationCommentValuesSerializer,
+                ),
+            ]
+            for name, queryset, serializer_class, values_class in cases:
+                # .all() so every run queries again instead of reusing the cache
+                before, old = self.run(
+                    lambda: JSONRenderer().render(
+                        {
+                            "status": "success",
+                            "data": serializer_class(
+                                list(queryset.all()), many=True
+                            ).data,
+                        }
+                    ),
+                    options["repeat"],
+                )
+                after, new = self.run(
+                    lambda: FastJSONRenderer().render(
+                        {
+                            "status": "success",
+                            "data": values_class(
+                                list(values_class.get_queryset(queryset))
+                            ).data,
+                        }
+                    ),
+                    options["repeat"],
+                )
+                if old != new:
+                    raise CommandError(f"{name}: fast path output differs")
+                self.stdout.write(
+                    f"{name}: {rows / before:,.0f} rows/s before, "
+                    f"{rows / after:,.0f} rows/s after ({before / after:.1f}x), "
+                    "identical bytes"
+                )
+
+            transaction.set_rollback(True)
+
+    def run(self, render, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main.helper import get_suggestion_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes persisted AI annotation suggestions older than "
+        "ANNOTATION_CACHE_TTL"
+    )
+
+    def handle(self, *args, **options):
+        deleted = get_suggestion_cache().prune()
+        self.stdout.write(f"Deleted {deleted} expired annotation suggestions")
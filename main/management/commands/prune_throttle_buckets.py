@@ -0,0 +1,13 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.models import ThrottleBucket
+
+
+class Command(BaseCommand):
+    help = "Deletes throttle buckets that have fully drained"
+
+    def handle(self, *args, **options):
+        deleted = ThrottleBucket.objects.prune(time.time())
+        self.stdout.write(f"Deleted {deleted} drained throttle buckets")
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes expired outstanding and blacklisted refresh tokens in small "
+        "batches, unlike flushexpiredtokens which deletes them in one statement"
+    )
+
+    def add_arguments(self, parser):
+        config = settings.TOKEN_BLACKLIST
+        parser.add_argument(
+            "--batch-size", type=int, default=config["PRUNE_BATCH_SIZE"]
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=config["PRUNE_SLEEP"],
+            help="seconds to pause between batches",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=cutoff).order_by("pk")
+        totals = {"outstanding": 0, "blacklisted": 0}
+
+        while pks := list(expired.values_list("pk", flat=True)[: options["batch_size"]]):
+            # blacklist rows go along through the cascade
+            _, deleted = OutstandingToken.objects.filter(pk__in=pks).delete()
+            totals["outstanding"] += deleted.get(OutstandingToken._meta.label, 0)
+            totals["blacklisted"] += deleted.get(BlacklistedToken._meta.label, 0)
+            if len(pks) == options["batch_size"]:
+                time.sleep(options["sleep"])
+
+        self.stdout.write(
+            f"Deleted {totals['outstanding']} outstanding and "
+            f"{totals['blacklisted']} blacklisted tokens expired before "
+            f"{cutoff:%Y-%m-%d %H:%M}"
+        )
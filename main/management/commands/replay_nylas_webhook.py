@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from main import webhooks
+from main.helper import get_participant_cache
+
+
+def load_payloads(path):
+    """
+    Reads recorded notification bodies from a JSON file (one payload or a
+    list of payloads) or a JSON lines file (one payload per line).
+    """
+    text = Path(path).read_text()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+
+class Command(BaseCommand):
+    help = (
+        "Signs recorded Nylas webhook payloads and replays them against the "
+        "webhook endpoint, in process or against a running server"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="recorded payload files")
+        parser.add_argument(
+            "--url", help="post to a running server instead, e.g. http://127.0.0.1:8000"
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="deliver every payload this many times, to exercise deduplication",
+        )
+        parser.add_argument(
+            "--secret", help="signing secret, defaults to NYLAS_WEBHOOK['SECRET']"
+        )
+
+    def handle(self, *args, **options):
+        secret = options["secret"] or settings.NYLAS_WEBHOOK["SECRET"]
+        if not secret:
+            raise CommandError("Set NYLAS_CLIENT_SECRET or pass --secret")
+        if options["url"] is None and secret != settings.NYLAS_WEBHOOK["SECRET"]:
+            settings.NYLAS_WEBHOOK = {**settings.NYLAS_WEBHOOK, "SECRET": secret}
+
+        payloads = [payload for path in options["paths"] for payload in load_payloads(path)]
+        if options["url"] is None:
+            setup_test_environment()  # lets the test client through ALLOWED_HOSTS
+        client = Client()
+        for payload in payloads:
+            body = json.dumps(payload).encode()
+            headers = {"X-Nylas-Signature": webhooks.sign(body, secret)}
+            for _ in range(options["repeat"]):
+                if options["url"]:
+                    res = requests.post(
+                        f"{options['url'].rstrip('/')}/api/webhooks/nylas/",
+                        data=body,
+                        headers={**headers, "Content-Type": "application/json"},
+                        timeout=30,
+                    )
+                    code, content = res.status_code, res.text
+                else:
+                    res = client.post(
+                        "/api/webhooks/nylas/",
+                        data=body,
+                        content_type="application/json",
+                        headers=headers,
+                    )
+                    code, content = res.status_code, res.content.decode()
+                self.stdout.write(f"{code} {content}")
+
+        if options["url"] is None:
+            webhooks.flush()
+            cache = get_participant_cache()
+            for payload in payloads:
+                for delta in payload.get("deltas", []):
+                    email_id = (delta.get("object_data") or {}).get("id")
+                    self.stdout.write(f"{email_id}: {cache.get(email_id)}")
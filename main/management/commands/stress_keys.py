@@ -0,0 +1,105 @@
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from main.models import Annotation
+
+
+def insert_annotations(email_id, worker, count, batch_size):
+    """
+    Inserts `count` annotations on `email_id`, alternating single saves and
+    bulk_create batches, and returns the ids it was given.
+    """
+    ids = []
+    try:
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            objs = [
+                Annotation(
+                    email_id=email_id,
+                    text="stress",
+                    user_email=f"w{worker}-{start + i}@stress.test",
+                    annotation_label="task",
+                )
+                for i in range(size)
+            ]
+            if start // batch_size % 2:
+                for obj in objs:
+                    obj.save()
+            else:
+                Annotation.objects.bulk_create(objs)
+            ids.extend(obj.id for obj in objs)
+    finally:
+        connections.close_all()
+    return ids
+
+
+def run_process(email_id, process, threads, count, batch_size):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [
+            pool.submit(
+                insert_annotations,
+                email_id,
+                f"{process}.{thread}",
+                count,
+                batch_size,
+            )
+            for thread in range(threads)
+        ]
+        return [key for future in futures for key in future.result()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Inserts annotations from concurrent processes and threads with save() "
+        "and bulk_create and checks every allocated id is unique"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--count", type=int, default=500, help="inserts per thread")
+        parser.add_argument("--batch-size", type=int, default=25)
+        parser.add_argument(
+            "--keep", action="store_true", help="keep the inserted rows"
+        )
+
+    def handle(self, *args, **options):
+        email_id = f"stress-{uuid.uuid4().hex[:12]}"
+        connections.close_all()  # children must not share the parent connection
+
+        started = time.perf_counter()
+        with multiprocessing.get_context("fork").Pool(options["processes"]) as pool:
+            results = pool.starmap(
+                run_process,
+                [
+                    (
+                        email_id,
+                        process,
+                        options["threads"],
+                        options["count"],
+                        options["batch_size"],
+                    )
+                    for process in range(options["processes"])
+                ],
+            )
+        elapsed = time.perf_counter() - started
+
+        ids = [key for result in results for key in result]
+        stored = Annotation.objects.for_thread(email_id).count()
+        self.stdout.write(
+            f"{len(ids)} inserts in {elapsed:.2f}s ({len(ids) / elapsed:.0f}/s), "
+            f"{len(set(ids))} distinct ids, {stored} rows stored"
+        )
+        if not options["keep"]:
+            Annotation.objects.for_thread(email_id).delete()
+
+        if len(set(ids)) != len(ids) or stored != len(ids):
+            raise CommandError("Duplicate or missing annotation ids")
+        if any(len(key) != 8 for key in ids):
+            raise CommandError("Allocated ids are not 8 characters long")
+        self.stdout.write(self.style.SUCCESS("All ids unique"))
@@ -0,0 +1,262 @@
+"""
+In-process request metrics in the Prometheus text format.
+
+`MetricsMiddleware` opens a `RequestTimings` for every request and records
+its total time once the response is ready. Code running inside the request
+adds the time spent in each dependency with `timed("<dependency>")`, and SQL
+executed on any connection is counted and timed by `instrument_connection`.
+Nothing is recorded, and the hooks return immediately, outside a request or
+when `settings.METRICS["ENABLED"]` is off.
+
+Each worker process keeps its own registry, so scrape every worker (or run
+one per container) to get the whole picture.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+def _format_value(value):
+    return repr(float(value)) if not isinstance(value, int) else str(value)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [
+        '%s="%s"'
+        % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+class Histogram:
+    """
+    Cumulative histogram with a fixed label set, rendered like a Prometheus
+    client histogram (`_bucket`, `_sum` and `_count` series).
+
+    Args:
+        name (str): Metric name.
+        documentation (str): HELP text.
+        labels (tuple): Label names, given in the same order to `observe`.
+        buckets (tuple): Ascending upper bounds; +Inf is added.
+    """
+
+    def __init__(self, name, documentation, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # per bucket counts, the last slot is +Inf, then sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0]
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label_values, series in sorted(snapshot.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                total += count
+                le = 'le="%s"' % (bound if bound == "+Inf" else _format_value(bound))
+                labels = _format_labels(self.labels, label_values, le)
+                lines.append(f"{self.name}_bucket{labels} {total}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time from the request reaching the middleware to the response being ready.",
+    ("endpoint", "method", "status"),
+)
+DEPENDENCY_DURATION = Histogram(
+    "http_request_dependency_seconds",
+    "Time a request spent in one dependency (db, nylas, openai, render).",
+    ("endpoint", "dependency"),
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per request.",
+    ("endpoint",),
+    buckets=QUERY_BUCKETS,
+)
+
+
+class CacheCounters:
+    """
+    Hit, miss and eviction counters of the application caches, read at scrape
+    time from the `CacheStats` each cache registers when it is built.
+
+    Args:
+        prefix (str): Metric name prefix, e.g. "app_cache".
+    """
+
+    FIELDS = (
+        ("hits", "Lookups answered by the cache."),
+        ("misses", "Lookups the cache could not answer."),
+        ("evictions", "Entries dropped to stay within the size bound."),
+    )
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, cache, stats):
+        """Exports `stats` (a `CacheStats`) under the label `cache`."""
+        with self._lock:
+            self._stats[cache] = stats
+
+    def collect(self):
+        with self._lock:
+            snapshot = {cache: stats.as_dict() for cache, stats in self._stats.items()}
+
+        lines = []
+        for field, documentation in self.FIELDS:
+            name = f"{self.prefix}_{field}_total"
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} counter")
+            for cache, values in sorted(snapshot.items()):
+                labels = _format_labels(("cache",), (cache,))
+                lines.append(f"{name}{labels} {values[field]}")
+        return lines
+
+
+CACHE_COUNTERS = CacheCounters("app_cache")
+REGISTRY = [REQUEST_DURATION, DEPENDENCY_DURATION, REQUEST_QUERIES, CACHE_COUNTERS]
+
+
+class RequestTimings:
+    """
+    Time per dependency and SQL count of the request being handled. Shared
+    with the worker threads of the request, hence the lock.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.dependencies = {}
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def add(self, dependency, seconds):
+        with self._lock:
+            self.dependencies[dependency] = self.dependencies.get(dependency, 0) + seconds
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.queries += 1
+            self.dependencies["db"] = self.dependencies.get("db", 0) + seconds
+
+    def record(self, endpoint, method, status):
+        REQUEST_DURATION.observe(
+            (endpoint, method, str(status)), time.perf_counter() - self.started
+        )
+        REQUEST_QUERIES.observe((endpoint,), self.queries)
+        for dependency, seconds in self.dependencies.items():
+            DEPENDENCY_DURATION.observe((endpoint, dependency), seconds)
+
+
+def start_request():
+    """Starts timing a request, returning the token to pass to `finish_request`."""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def finish_request(token, request, response):
+    timings, context_token = token
+    _current.reset(context_token)
+    match = getattr(request, "resolver_match", None)
+    # the route pattern, not the path, keeps the label set small
+    endpoint = match.route if match is not None else "unmatched"
+    timings.record(endpoint, request.method, response.status_code)
+
+
+def timed(dependency):
+    """
+    Decorator adding the time spent in the function (sync or async) to the
+    `dependency` time of the current request.
+
+    Args:
+        dependency (str): Label of the dependency, e.g. "nylas".
+    """
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if (timings := _current.get()) is None:
+                    return await func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    timings.add(dependency, time.perf_counter() - started)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if (timings := _current.get()) is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings.add(dependency, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    if (timings := _current.get()) is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(time.perf_counter() - started)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """
+    `connection_created` receiver that counts and times every statement run
+    on the new connection, whichever thread or alias it belongs to.
+    """
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,108 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from main.metrics import finish_request, start_request
+from main.routers import replica_aliases, reset, use_replica
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class MetricsMiddleware:
+    """
+    Records the total time, per-dependency time and SQL count of every
+    request into `main.metrics`. Removed from the stack entirely when
+    `settings.METRICS["ENABLED"]` is off. Place it first so the measured
+    time covers the other middleware too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = start_request()
+        response = self.get_response(request)
+        finish_request(token, request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = start_request()
+        response = await self.get_response(request)
+        finish_request(token, request, response)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serves reads of safe requests from a replica (see `main.routers`).
+
+    A successful write marks the client as reading from the primary for
+    `READ_REPLICA["STICKY_SECONDS"]`, so it sees its own write: the
+    deadline is set as a cookie for browsers and returned in a header
+    that API clients echo back. Removed from the stack when no replica
+    is configured.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.config = settings.READ_REPLICA
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def reads_primary(self, request):
+        deadline = request.headers.get(self.config["HEADER"]) or request.COOKIES.get(
+            self.config["COOKIE"]
+        )
+        try:
+            return float(deadline) > time.time()
+        except (TypeError, ValueError):
+            return False
+
+    def start(self, request):
+        if request.method in SAFE_METHODS and not self.reads_primary(request):
+            return use_replica()
+        return None
+
+    def finish(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            seconds = self.config["STICKY_SECONDS"]
+            deadline = f"{time.time() + seconds:.0f}"
+            response.set_cookie(
+                self.config["COOKIE"], deadline, max_age=seconds, samesite="Lax"
+            )
+            response[self.config["HEADER"]] = deadline
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset(token)
+        return self.finish(request, response)
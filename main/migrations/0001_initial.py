@@ -0,0 +1,138 @@
+# Generated by Django 4.2.5 on 2026-10-17 02:32
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import main.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAccount',
+            fields=[
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, help_text='Designates whether this entry has been deleted.', verbose_name='Deactivate Account')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('first_name', models.CharField(max_length=50, validators=[main.models.validate_name])),
+                ('last_name', models.CharField(max_length=50, validators=[main.models.validate_name])),
+                ('email', models.EmailField(db_index=True, max_length=255, unique=True)),
+                ('is_active', models.BooleanField(default=False, verbose_name='Activate Account')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Annotation',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, help_text='Designates whether this entry has been deleted.', verbose_name='Deactivate Account')),
+                ('id', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('email_id', models.CharField(max_length=50)),
+                ('text', models.TextField()),
+                ('position', models.CharField(blank=True, max_length=255, null=True)),
+                ('user_email', models.EmailField(db_index=True, max_length=255)),
+                ('annotation_label', models.CharField(choices=[('task', 'task'), ('meeting_request', 'meeting request'), ('follow-up', 'follow-up'), ('question', 'question'), ('deadline', 'deadline'), ('approval', 'approval'), ('feedback', 'feedback'), ('review', 'review')], max_length=15)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserBusiness',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, help_text='Designates whether this entry has been deleted.', verbose_name='Deactivate Account')),
+                ('business_name', models.CharField(max_length=50)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', '-updated_at'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UserAvailableTime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, help_text='Designates whether this entry has been deleted.', verbose_name='Deactivate Account')),
+                ('day_of_week', models.CharField(choices=[('Monday', 'Monday'), ('Tuesday', 'Tuesday'), ('Wednesday', 'Wednesday'), ('Thursday', 'Thursday'), ('Friday', 'Friday'), ('Saturday', 'Saturday'), ('Sunday', 'Sunday')], max_length=10)),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('is_group_available', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_time', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserAppointment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, help_text='Designates whether this entry has been deleted.', verbose_name='Deactivate Account')),
+                ('message', models.TextField(blank=True, null=True)),
+                ('name', models.CharField(max_length=50, validators=[main.models.validate_name])),
+                ('email', models.EmailField(db_index=True, max_length=255, unique=True)),
+                ('phone_number', models.CharField(blank=True, max_length=20, null=True, validators=[main.models.validate_phone_number])),
+                ('session_time', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='user_session', to='main.useravailabletime')),
+            ],
+            options={
+                'ordering': ['-created_at', '-updated_at'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AnnotationComment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False, help_text='Designates whether this entry has been deleted.', verbose_name='Deactivate Account')),
+                ('comment', models.TextField()),
+                ('author_email', models.EmailField(db_index=True, max_length=255)),
+                ('annotation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.annotation')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='annotation',
+            constraint=models.UniqueConstraint(fields=('email_id', 'annotation_label', 'user_email'), name='unique_thread_annotation'),
+        ),
+        migrations.AddField(
+            model_name='useraccount',
+            name='groups',
+            field=models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups'),
+        ),
+        migrations.AddField(
+            model_name='useraccount',
+            name='user_permissions',
+            field=models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions'),
+        ),
+        migrations.AddConstraint(
+            model_name='useravailabletime',
+            constraint=models.UniqueConstraint(fields=('user', 'day_of_week', 'start_time', 'end_time'), name='unique_user_time'),
+        ),
+        migrations.AddConstraint(
+            model_name='annotationcomment',
+            constraint=models.UniqueConstraint(fields=('annotation', 'author_email', 'comment'), name='unique_author_comment'),
+        ),
+    ]
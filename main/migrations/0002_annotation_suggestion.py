@@ -0,0 +1,24 @@
+# Generated by Django 4.2.5 on 2026-10-17 02:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnotationSuggestion',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('result', models.JSONField()),
+                ('prompt_version', models.CharField(max_length=20)),
+                ('model_name', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
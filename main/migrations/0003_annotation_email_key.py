@@ -0,0 +1,38 @@
+# Generated by Django 4.2.5 on 2026-10-17 02:32
+
+from django.db import migrations, models
+import django.db.models.functions.text
+import main.models
+
+
+def backfill_email_key(apps, schema_editor):
+    Annotation = apps.get_model("main", "Annotation")
+    Annotation.objects.update(email_key=django.db.models.functions.text.Lower("email_id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_annotation_suggestion'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='annotation',
+            options={'ordering': ['-created_at', '-updated_at']},
+        ),
+        migrations.AddField(
+            model_name='annotation',
+            name='email_key',
+            field=main.models.NormalizedKeyField(default='', max_length=50, source='email_id'),
+        ),
+        migrations.RunPython(backfill_email_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['email_key', 'is_deleted', '-created_at'], name='annotation_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(django.db.models.functions.text.Upper('id'), name='annotation_id_upper_idx'),
+        ),
+    ]
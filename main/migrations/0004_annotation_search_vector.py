@@ -0,0 +1,73 @@
+# Generated by Django 4.2.5 on 2026-10-17 02:34
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_DOCUMENT = """
+    setweight(to_tsvector('english', coalesce({row}text, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}annotation_label, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce({row}position, '')), 'C') ||
+    setweight(to_tsvector('simple', coalesce({row}user_email, '')), 'D')
+"""
+
+CREATE_TRIGGER = f"""
+CREATE OR REPLACE FUNCTION main_annotation_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_DOCUMENT.format(row="NEW.")};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER main_annotation_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF text, annotation_label, position, user_email
+    ON main_annotation
+    FOR EACH ROW EXECUTE FUNCTION main_annotation_search_vector_update();
+
+UPDATE main_annotation SET search_vector = {SEARCH_DOCUMENT.format(row="")};
+
+CREATE INDEX annotation_search_idx ON main_annotation USING gin (search_vector);
+"""
+
+DROP_TRIGGER = """
+DROP INDEX IF EXISTS annotation_search_idx;
+DROP TRIGGER IF EXISTS main_annotation_search_vector_trigger ON main_annotation;
+DROP FUNCTION IF EXISTS main_annotation_search_vector_update();
+"""
+
+
+def create_search_trigger(apps, schema_editor):
+    # full-text search is Postgres only; other backends fall back to ILIKE search
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_annotation_email_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='annotation',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='annotation',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='annotation_search_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_trigger, drop_search_trigger),
+            ],
+        ),
+    ]
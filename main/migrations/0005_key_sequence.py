@@ -0,0 +1,33 @@
+# Generated by Django 4.2.5 on 2026-10-17 02:37
+
+from django.db import migrations, models
+
+
+def create_key_sequence(apps, schema_editor):
+    # Postgres allocates annotation keys from a native sequence; other
+    # backends use the KeySequence table
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("CREATE SEQUENCE IF NOT EXISTS main_annotation_key_seq")
+
+
+def drop_key_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP SEQUENCE IF EXISTS main_annotation_key_seq")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_annotation_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KeySequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_key_sequence, drop_key_sequence),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-17 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_key_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='annotationcomment',
+            index=models.Index(fields=['annotation', 'is_deleted', '-created_at'], name='comment_annotation_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.5 on 2026-10-17 02:47
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_resource_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAnnotation',
+            fields=[
+                ('id', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('email_id', models.CharField(max_length=50)),
+                ('email_key', models.CharField(db_index=True, max_length=50)),
+                ('text', models.TextField()),
+                ('position', models.CharField(blank=True, max_length=255, null=True)),
+                ('user_email', models.EmailField(max_length=255)),
+                ('annotation_label', models.CharField(choices=[('task', 'task'), ('meeting_request', 'meeting request'), ('follow-up', 'follow-up'), ('question', 'question'), ('deadline', 'deadline'), ('approval', 'approval'), ('feedback', 'feedback'), ('review', 'review')], max_length=15)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('is_deleted', models.BooleanField(default=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedAnnotationComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('comment', models.TextField()),
+                ('author_email', models.EmailField(max_length=255)),
+                ('annotation_id', models.CharField(db_index=True, max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('is_deleted', models.BooleanField(default=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='annotation',
+            name='annotation_thread_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='annotationcomment',
+            name='comment_annotation_idx',
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['email_key', '-created_at'], name='annotation_live_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotationcomment',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['annotation', '-created_at'], name='comment_live_annotation_idx'),
+        ),
+    ]
@@ -1,15 +1,21 @@
 import re
-import uuid, base58
+import uuid
 
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager, PermissionsMixin
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError, models
+from django.db import connections, models, router
+from django.db.models import Count, F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber, Upper
 from django.db.models.query import QuerySet
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.db import transaction
 
 from main.constants import ANNOTATION
+from main.keygen import KeyAllocator
 
 
 def validate_name(value):
@@ -170,56 +176,173 @@ class UserAppointment(BaseModel):
     )
 
 
+def normalize_email_id(email_id):
+    """Canonical, case-insensitive form of a Nylas email id."""
+    return email_id.lower() if email_id else email_id
+
+
+class NormalizedKeyField(models.CharField):
+    """
+    Read-only column holding the normalized value of another field. It is
+    filled in `pre_save`, so both `save` and `bulk_create` keep it in sync.
+    """
+
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        kwargs.setdefault("editable", False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["source"] = self.source
+        kwargs.pop("editable", None)
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = normalize_email_id(getattr(model_instance, self.source))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+class AnnotationQuerySet(QuerySet):
+    def for_thread(self, email_id):
+        """
+        Case-insensitive match on the thread id that can use the
+        `email_key` indexes, unlike `email_id__iexact`
+        """
+        return self.filter(email_key=normalize_email_id(email_id))
+
+    def for_threads(self, email_ids):
+        """`for_thread` over several threads, as one `email_key IN (...)` filter"""
+        return self.filter(email_key__in={normalize_email_id(e) for e in email_ids})
+
+    def latest_per_thread(self, limit):
+        """
+        Keeps the `limit` newest annotations of each thread, in
+        `Meta.ordering`. The rank is a window function over `email_key`, so
+        any number of threads is still a single query.
+        """
+        ordering = [*self.model._meta.ordering, "-pk"]
+        return (
+            self.annotate(
+                thread_rank=Window(
+                    RowNumber(), partition_by=F("email_key"), order_by=ordering
+                )
+            )
+            .filter(thread_rank__lte=limit)
+            .order_by("email_key", *ordering)
+        )
+
+    def with_comment_summary(self, latest=3):
+        """
+        Annotates each annotation with `comment_count`, its number of live
+        comments, and prefetches its `latest` newest live comments into
+        `latest_comments`. The prefetch is one windowed query for all
+        annotations, so a thread of any size loads in two statements.
+        """
+        comments = AnnotationComment.objects.filter(is_deleted=False).order_by(
+            "-created_at", "-id"
+        )
+        queryset = self
+        if not queryset.query.order_by:
+            # Meta.ordering is not applied to aggregate queries, keep it explicitly
+            queryset = queryset.order_by(*self.model._meta.ordering)
+        return queryset.annotate(
+            comment_count=Count(
+                "annotationcomment", filter=Q(annotationcomment__is_deleted=False)
+            )
+        ).prefetch_related(
+            Prefetch(
+                "annotationcomment_set",
+                queryset=comments[:latest],
+                to_attr="latest_comments",
+            )
+        )
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        missing = [obj for obj in objs if not obj.pk]
+        if missing:
+            keys = annotation_keys.allocate(len(missing), using=self.db)
+            for obj, key in zip(missing, keys):
+                obj.pk = key
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class Annotation(BaseModel):
     id = models.CharField(primary_key=True, max_length=10)
     email_id = models.CharField(max_length=50)
+    # lowercase email_id, used for case-insensitive thread lookups
+    email_key = NormalizedKeyField(max_length=50, source="email_id", default="")
     text = models.TextField()
     position = models.CharField(max_length=255, null=True, blank=True)
     user_email = models.EmailField(
         db_index=True, max_length=255
     )  # not authenticating user
     annotation_label = models.CharField(max_length=15, choices=ANNOTATION)
+    # weighted text/label/position/user_email document, maintained by a
+    # database trigger (see migration 0004) so bulk writes stay in sync
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = AnnotationQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
-        if self._state.adding:
-            max_retries = 5
-            for _ in range(max_retries):
-                try:
-                    with transaction.atomic():
-                        self.id = self.generate_key()
-                        return super().save(*args, **kwargs)
-                except IntegrityError as e:
-                    # Check if the IntegrityError is due to the "unique_thread_annotation" constraint
-                    if "unique_thread_annotation" in str(e.__cause__):
-                        raise e
-                    continue
-            raise IntegrityError(
-                "Unable to generate a unique key after multiple retries"
-            )
+        if self._state.adding and not self.id:
+            self.id = self.generate_key(using=kwargs.get("using"))
         return super().save(*args, **kwargs)
 
-    def generate_key(self) -> str:
+    def generate_key(self, using=None) -> str:
         """
-        Generates a random base58-encoded string of length 8.
+        Allocates a unique base58-encoded key of length 8.
 
         Returns:
-            str: A random base58-encoded string of length 8.
+            str: A base58-encoded string of length 8 that no other annotation
+                uses or will be given.
         """
-        base58_id = base58.b58encode(uuid.uuid4().bytes[:10]).decode("utf-8")
-        return base58_id[:8]
+        return annotation_keys.allocate(using=using)[0]
 
-    class Meta:
+    class Meta(BaseModel.Meta):
         constraints = [
             models.UniqueConstraint(
                 fields=["email_id", "annotation_label", "user_email"],
                 name="unique_thread_annotation",
             )
         ]
+        indexes = [
+            # thread listing, newest first; live rows only, so soft-deleted
+            # annotations do not bloat it
+            models.Index(
+                fields=["email_key", "-created_at"],
+                name="annotation_live_thread_idx",
+                condition=Q(is_deleted=False),
+            ),
+            # serves id__iexact, which compiles to UPPER("id"::text)
+            models.Index(Upper("id"), name="annotation_id_upper_idx"),
+            GinIndex(fields=["search_vector"], name="annotation_search_idx"),
+        ]
 
     def __str__(self) -> str:
         return self.id
 
 
+annotation_keys = KeyAllocator(
+    Annotation, "annotation", block_size=settings.ANNOTATION_KEY_BLOCK_SIZE
+)
+
+
+class KeySequence(models.Model):
+    """
+    Key sequence counters for databases without native sequences,
+    see `main.keygen.KeyAllocator`
+    """
+
+    name = models.CharField(primary_key=True, max_length=50)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return self.name
+
+
 class AnnotationComment(BaseModel):
     comment = models.TextField()
     author_email = models.EmailField(db_index=True, max_length=255)
@@ -232,3 +355,173 @@ class AnnotationComment(BaseModel):
                 name="unique_author_comment",
             )
         ]
+        indexes = [
+            # newest live comments per annotation, see with_comment_summary
+            models.Index(
+                fields=["annotation", "-created_at"],
+                name="comment_live_annotation_idx",
+                condition=Q(is_deleted=False),
+            ),
+        ]
+
+
+class ArchivedAnnotation(models.Model):
+    """
+    Soft-deleted annotation moved out of the live table by the
+    `archive_deleted` command
+    """
+
+    id = models.CharField(primary_key=True, max_length=10)
+    email_id = models.CharField(max_length=50)
+    email_key = models.CharField(max_length=50, db_index=True)
+    text = models.TextField()
+    position = models.CharField(max_length=255, null=True, blank=True)
+    user_email = models.EmailField(max_length=255)
+    annotation_label = models.CharField(max_length=15, choices=ANNOTATION)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    is_deleted = models.BooleanField(default=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return self.id
+
+
+class ArchivedAnnotationComment(models.Model):
+    """
+    Soft-deleted comment, or comment of an archived annotation, moved out of
+    the live table by the `archive_deleted` command
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    comment = models.TextField()
+    author_email = models.EmailField(max_length=255)
+    annotation_id = models.CharField(max_length=10, db_index=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    is_deleted = models.BooleanField(default=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return str(self.id)
+
+
+class ResourceVersionManager(models.Manager):
+    def bump(self, keys, using=None):
+        """
+        Increments the version of each key in `keys`, creating missing ones,
+        as part of the caller's transaction.
+        """
+        using = using or router.db_for_write(self.model)
+        table = connections[using].ops.quote_name(self.model._meta.db_table)
+        now = timezone.now()
+        with connections[using].cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (key, version, updated_at) VALUES (%s, 1, %s) "
+                f"ON CONFLICT (key) DO UPDATE SET version = {table}.version + 1, "
+                "updated_at = excluded.updated_at",
+                [(key, now) for key in sorted(set(keys))],
+            )
+
+    def current(self, key):
+        """
+        Returns the `(version, updated_at)` of `key` without writing, or
+        `(0, None)` for a resource no write has touched yet.
+        """
+        row = self.filter(key=key).values_list("version", "updated_at").first()
+        return row or (0, None)
+
+
+class ResourceVersion(models.Model):
+    """
+    Monotonic version of a thread ("thread:<email_key>") or of one
+    annotation's comments ("annotation:<id>"), bumped by every write that
+    changes what their endpoints return. Used for ETag/Last-Modified.
+    """
+
+    key = models.CharField(primary_key=True, max_length=80)
+    version = models.BigIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = ResourceVersionManager()
+
+    @staticmethod
+    def thread_key(email_id):
+        return f"thread:{normalize_email_id(email_id)}"
+
+    @staticmethod
+    def annotation_key(annotation_id):
+        return f"annotation:{annotation_id}"
+
+    def __str__(self) -> str:
+        return f"{self.key}@{self.version}"
+
+
+class ThrottleBucketManager(models.Manager):
+    def consume(self, key, interval, window, now, using=None):
+        """
+        Takes one request from the GCRA bucket of `key` in a single atomic
+        upsert, so concurrent workers never both take the last slot.
+
+        Args:
+            key (str): Throttle key.
+            interval (float): Seconds each request adds to the bucket.
+            window (float): Seconds of requests the bucket holds (the burst).
+            now (float): Current unix time.
+
+        Returns:
+            float: 0 if the request is allowed, else seconds until it would be.
+        """
+        using = using or router.db_for_write(self.model)
+        table = connections[using].ops.quote_name(self.model._meta.db_table)
+        # the later of the stored arrival time and now, portable to SQLite
+        start = f"(CASE WHEN {table}.tat > %s THEN {table}.tat ELSE %s END)"
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (key, tat) VALUES (%s, %s) "
+                f"ON CONFLICT (key) DO UPDATE SET tat = {start} + %s "
+                f"WHERE {start} + %s <= %s RETURNING tat",
+                [key, now + interval, now, now, interval, now, now, interval, now + window],
+            )
+            if cursor.fetchone() is not None:
+                return 0.0
+            cursor.execute(f"SELECT tat FROM {table} WHERE key = %s", [key])
+            row = cursor.fetchone()
+        if row is None:  # pruned in between
+            return 0.0
+        return max(row[0], now) + interval - now - window
+
+    def prune(self, now):
+        """Deletes buckets that have fully drained; they are the same as missing ones."""
+        return self.filter(tat__lt=now).delete()[0]
+
+
+class ThrottleBucket(models.Model):
+    """
+    GCRA state of one throttle key, the theoretical arrival time of its next
+    request as unix time. See `main.throttling`.
+    """
+
+    key = models.CharField(primary_key=True, max_length=255)
+    tat = models.FloatField()
+
+    objects = ThrottleBucketManager()
+
+    def __str__(self) -> str:
+        return self.key
+
+
+class AnnotationSuggestion(models.Model):
+    """
+    Persisted AI auto-annotation results, keyed by a hash of the normalized
+    text, prompt version and model name
+    """
+
+    key = models.CharField(primary_key=True, max_length=64)
+    result = models.JSONField()
+    prompt_version = models.CharField(max_length=20)
+    model_name = models.CharField(max_length=50)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self) -> str:
+        return self.key
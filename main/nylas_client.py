@@ -0,0 +1,407 @@
+import asyncio
+import email.utils
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("server_log")
+
+RETRY_STATUS_CODES = {429, 503}
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limiter with additive-increase/multiplicative-decrease
+    sizing: the limit halves whenever the upstream throttles us and grows
+    back by one after a full window of successful calls.
+
+    Args:
+        initial (int): Starting number of concurrent calls allowed.
+        minimum (int): Lower bound the limit never shrinks below.
+        maximum (int): Upper bound the limit never grows above.
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=50):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < self.limit, timeout):
+                raise TimeoutError("Timed out waiting for a free Nylas request slot")
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self, timeout=None):
+        self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify()
+
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._successes = 0
+
+
+class AsyncAdaptiveLimiter:
+    """
+    `AdaptiveLimiter` for coroutines: waiting for a slot suspends the task
+    instead of blocking the event loop thread. Not thread-safe; use one per
+    event loop.
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=50):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = None
+
+    @property
+    def _waiters(self):
+        # created lazily so the condition binds to the running loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self, timeout=None):
+        async with self._waiters:
+            try:
+                await asyncio.wait_for(
+                    self._waiters.wait_for(lambda: self.in_flight < self.limit),
+                    timeout,
+                )
+            except asyncio.TimeoutError as ex:
+                raise TimeoutError(
+                    "Timed out waiting for a free Nylas request slot"
+                ) from ex
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._waiters:
+            self.in_flight -= 1
+            self._waiters.notify()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+
+    def on_throttle(self):
+        self.limit = max(self.minimum, self.limit // 2)
+        self._successes = 0
+
+
+def parse_retry_after(value):
+    """
+    Parses a `Retry-After` header given either as seconds or an HTTP date.
+
+    Returns:
+        float | None: Seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class _RetryPolicy:
+    def _can_retry(self, attempt, started, delay):
+        return (
+            attempt < self.max_retries
+            and time.monotonic() + delay - started <= self.deadline
+        )
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after) + random.uniform(
+                0, self.backoff_factor
+            )
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff_factor * 2**attempt)
+        )
+
+
+class NylasClient(_RetryPolicy):
+    """
+    Reusable Nylas API client. It owns a pooled keep-alive `requests.Session`,
+    retries 429/503 responses and failed connections with jittered backoff
+    (honouring `Retry-After`), and bounds concurrent calls with an
+    `AdaptiveLimiter` that shrinks while Nylas is throttling us.
+
+    Read timeouts are not retried: the request may have reached Nylas, and
+    retrying would hold the worker for several read timeouts. No retry is
+    started once it would end past `deadline` seconds from the first attempt.
+
+    Args:
+        base_url (str): Nylas API root, e.g. https://api.nylas.com or a local stub server.
+        token (str): Access token sent as a Bearer authorization header.
+        pool_size (int): Number of keep-alive connections kept per host.
+        max_retries (int): Retries after the first attempt before giving up.
+        backoff_factor (float): Base delay in seconds of the exponential backoff.
+        max_backoff (float): Upper bound on a single backoff delay in seconds.
+        timeout (tuple): (connect, read) timeout passed to requests.
+        max_concurrency (int): Upper bound of the adaptive concurrency limit.
+        acquire_timeout (float): Seconds to wait for a free request slot.
+        deadline (float): Seconds after the first attempt past which no
+            retry is started.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        token,
+        pool_size=10,
+        max_retries=3,
+        backoff_factor=0.5,
+        max_backoff=30,
+        timeout=(60, 90),
+        max_concurrency=20,
+        acquire_timeout=None,
+        deadline=120,
+    ):
+        self.base_url = (base_url or "").rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.deadline = deadline
+        self.limiter = AdaptiveLimiter(
+            initial=max_concurrency, maximum=max_concurrency
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Accept": "application/json",
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json",
+            }
+        )
+
+    def request(self, method, path, **kwargs):
+        """
+        Sends a request to Nylas, retrying throttled and failed connections.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Path relative to the base url, e.g. /messages/<id>.
+
+        Returns:
+            requests.Response: The last response received.
+
+        Raises:
+            requests.RequestException: If the request still fails after all retries.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        started = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.limiter.slot(self.acquire_timeout):
+                    res = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError as ex:
+                # includes ConnectTimeout; a ReadTimeout is raised as is
+                delay = self._backoff(attempt)
+                if not self._can_retry(attempt, started, delay):
+                    raise
+                logger.warning(
+                    "Nylas %s %s failed (%s), retrying in %.2fs", method, path, ex, delay
+                )
+                time.sleep(delay)
+                continue
+
+            if res.status_code not in RETRY_STATUS_CODES:
+                self.limiter.on_success()
+                return res
+
+            self.limiter.on_throttle()
+            delay = self._backoff(
+                attempt, parse_retry_after(res.headers.get("Retry-After"))
+            )
+            if not self._can_retry(attempt, started, delay):
+                return res
+            res.close()
+            logger.warning(
+                "Nylas %s %s returned %s, retrying in %.2fs",
+                method,
+                path,
+                res.status_code,
+                delay,
+            )
+            time.sleep(delay)
+
+    def get_message(self, message_id):
+        return self.request("GET", f"/messages/{message_id}")
+
+    def close(self):
+        self.session.close()
+
+
+def _json_body(raw):
+    # throttling proxies and gateways answer with HTML or nothing at all
+    try:
+        return json.loads(raw) if raw else {}
+    except ValueError:
+        return {}
+
+
+class AsyncNylasClient(_RetryPolicy):
+    """
+    aiohttp counterpart of `NylasClient` for async views. It shares the
+    retry policy and adaptive concurrency limit but suspends instead of
+    blocking, so one event loop can hold many in-flight Nylas calls.
+
+    The underlying `aiohttp.ClientSession` is bound to the event loop it was
+    first used on; build one client per loop.
+
+    Args:
+        Same as `NylasClient`.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        token,
+        pool_size=10,
+        max_retries=3,
+        backoff_factor=0.5,
+        max_backoff=30,
+        timeout=(60, 90),
+        max_concurrency=20,
+        acquire_timeout=None,
+        deadline=120,
+    ):
+        self.base_url = (base_url or "").rstrip("/")
+        self.token = token
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = aiohttp.ClientTimeout(
+            sock_connect=timeout[0], sock_read=timeout[1]
+        )
+        self.acquire_timeout = acquire_timeout
+        self.deadline = deadline
+        self.limiter = AsyncAdaptiveLimiter(
+            initial=max_concurrency, maximum=max_concurrency
+        )
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=self.timeout,
+                headers={
+                    "Accept": "application/json",
+                    "Authorization": f"Bearer {self.token}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._session
+
+    async def request(self, method, path, **kwargs):
+        """
+        Sends a request to Nylas, retrying throttled and failed connections.
+
+        Returns:
+            tuple: The (status code, decoded JSON body) of the last response,
+                with an empty dict for a body that is not JSON.
+
+        Raises:
+            aiohttp.ClientError: If the request still fails after all retries.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        started = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(self.acquire_timeout)
+            try:
+                async with self.session.request(method, url, **kwargs) as res:
+                    status_code = res.status
+                    retry_after = res.headers.get("Retry-After")
+                    raw = await res.read()
+            except asyncio.TimeoutError:
+                # aiohttp reports socket timeouts as one error type; like the
+                # sync client, a request that may have reached Nylas is not retried
+                raise
+            except aiohttp.ClientConnectionError as ex:
+                delay = self._backoff(attempt)
+                if not self._can_retry(attempt, started, delay):
+                    raise
+                logger.warning(
+                    "Nylas %s %s failed (%s), retrying in %.2fs", method, path, ex, delay
+                )
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                await self.limiter.release()
+
+            if status_code not in RETRY_STATUS_CODES:
+                self.limiter.on_success()
+                return status_code, _json_body(raw)
+
+            self.limiter.on_throttle()
+            delay = self._backoff(attempt, parse_retry_after(retry_after))
+            if not self._can_retry(attempt, started, delay):
+                return status_code, _json_body(raw)
+            logger.warning(
+                "Nylas %s %s returned %s, retrying in %.2fs",
+                method,
+                path,
+                status_code,
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+    async def get_message(self, message_id):
+        return await self.request("GET", f"/messages/{message_id}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
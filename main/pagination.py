@@ -0,0 +1,112 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first keyset pagination on (created_at, pk).
+
+    Each page is a single indexed range query continuing after the last row of
+    the previous page, so deep pages cost the same as the first one, rows
+    inserted meanwhile never shift or repeat results, and no COUNT(*) is run.
+    The cursor is an opaque token; clients only follow the `next` link.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by("-created_at", "-pk")
+        if position := self.decode_cursor(request):
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        self.next_position = (rows[-1].created_at, rows[-1].pk) if self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            created_at = parse_datetime(position["t"])
+            pk = position["k"]
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def encode_cursor(self, position):
+        created_at, pk = position
+        payload = json.dumps({"t": created_at.isoformat(), "k": pk}, separators=(",", ":"))
+        encoded = base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
+
+
+class CursorOrOffsetPagination(BasePagination):
+    """
+    Uses `KeysetPagination` when the client asks for it with `?cursor=` or
+    `?pagination=cursor`, and the default `LimitOffsetPagination` otherwise,
+    so existing clients keep their limit/offset contract.
+    """
+
+    mode_query_param = "pagination"
+
+    def __init__(self):
+        self.paginator = None
+
+    def get_paginator(self, request):
+        if KeysetPagination.cursor_query_param in request.query_params or (
+            request.query_params.get(self.mode_query_param) == "cursor"
+        ):
+            return KeysetPagination()
+        return LimitOffsetPagination()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
@@ -0,0 +1,59 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_read_alias = contextvars.ContextVar("read_alias", default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica_")]
+
+
+def use_replica():
+    """
+    Sends the reads of the current request or task to one replica, picked
+    at random, until `reset` is called with the returned token. Returns
+    None when no replica is configured.
+    """
+    if not (aliases := replica_aliases()):
+        return None
+    return _read_alias.set(random.choice(aliases))
+
+
+def reset(token):
+    if token is not None:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def read_primary():
+    """Sends the reads inside the block to "default", whatever the request uses."""
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the replica chosen for the current request by
+    `ReplicaRoutingMiddleware`, and everything else to "default". Outside
+    such requests (writes, commands, signals) reads also go to "default".
+    Replicas are copies of "default", so relations across them are allowed,
+    and migrations only run on "default".
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
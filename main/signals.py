@@ -0,0 +1,62 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from main.authentication import invalidate_user
+from main.documents import get_thread_documents
+from main.events import change_type, publish_on_commit
+from main.models import Annotation, AnnotationComment, ResourceVersion, UserAccount
+from main.serializer import AnnotationCommentSerializer, RetrieveAnnotationSerializer
+
+
+def record_changes(email_keys, annotation_ids=(), using=None):
+    """
+    Bumps the versions of the changed threads and annotations inside the
+    current transaction, and drops their cached thread documents once it
+    commits. Writes that skip model signals, like `bulk_create`, call this
+    directly.
+    """
+    email_keys = set(email_keys)
+    ResourceVersion.objects.bump(
+        [ResourceVersion.thread_key(email_key) for email_key in email_keys]
+        + [ResourceVersion.annotation_key(pk) for pk in annotation_ids],
+        using=using,
+    )
+    get_thread_documents().invalidate_on_commit(email_keys, using=using)
+
+
+@receiver(post_save, sender=Annotation)
+@receiver(post_delete, sender=Annotation)
+def annotation_changed(sender, instance, using, signal, created=False, **kwargs):
+    record_changes([instance.email_key], [instance.pk], using=using)
+    publish_on_commit(
+        instance.email_key,
+        change_type("annotation", signal, created, instance.is_deleted),
+        RetrieveAnnotationSerializer(instance).data,
+        using=using,
+    )
+
+
+@receiver(post_save, sender=AnnotationComment)
+@receiver(post_delete, sender=AnnotationComment)
+def comment_changed(sender, instance, using, signal, created=False, **kwargs):
+    # looked up rather than read from instance.annotation, which may already
+    # be gone when comments are deleted along with their annotation
+    email_keys = list(
+        Annotation.objects.using(using)
+        .filter(pk=instance.annotation_id)
+        .values_list("email_key", flat=True)
+    )
+    record_changes(email_keys, [instance.annotation_id], using=using)
+    for email_key in email_keys:
+        publish_on_commit(
+            email_key,
+            change_type("comment", signal, created, instance.is_deleted),
+            AnnotationCommentSerializer(instance).data,
+            using=using,
+        )
+
+
+@receiver(post_save, sender=UserAccount)
+@receiver(post_delete, sender=UserAccount)
+def user_changed(sender, instance, using, **kwargs):
+    invalidate_user(instance.pk, using=using)
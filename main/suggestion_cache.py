@@ -0,0 +1,91 @@
+import hashlib
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError
+from django.utils import timezone
+
+from main.cache import CacheStats, build_cache
+from main.models import AnnotationSuggestion
+
+logger = logging.getLogger("server_log")
+
+
+def normalize_text(text):
+    """Collapses whitespace and case so near-identical snippets share a key."""
+    return " ".join(text.split()).casefold()
+
+
+class SuggestionCache:
+    """
+    Content-addressed cache of AI auto-annotation results. Entries live in a
+    size-bounded TTL cache and, when `PERSIST` is enabled, in the
+    `AnnotationSuggestion` table so they survive restarts.
+
+    Args:
+        config (dict): `settings.ANNOTATION_CACHE`.
+    """
+
+    def __init__(self, config):
+        self.memory = build_cache(config, prefix="annotation:")
+        self.timeout = config.get("TIMEOUT", 300)
+        self.persist = config.get("PERSIST", False)
+        self.db_stats = CacheStats()
+
+    @staticmethod
+    def make_key(text, prompt_version, model_name):
+        payload = "\x1f".join([prompt_version, model_name, normalize_text(text)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        if (value := self.memory.get(key)) is not None or not self.persist:
+            return value
+
+        cutoff = timezone.now() - timedelta(seconds=self.timeout)
+        try:
+            value = (
+                AnnotationSuggestion.objects.filter(key=key, created_at__gte=cutoff)
+                .values_list("result", flat=True)
+                .first()
+            )
+        except DatabaseError as ex:
+            logger.warning("Unable to read annotation cache: %s", ex)
+            return None
+        self.db_stats.record(value is not None)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key, value, prompt_version, model_name):
+        self.memory.set(key, value)
+        if not self.persist:
+            return
+        try:
+            AnnotationSuggestion.objects.update_or_create(
+                key=key,
+                defaults={
+                    "result": value,
+                    "prompt_version": prompt_version,
+                    "model_name": model_name,
+                    "created_at": timezone.now(),
+                },
+            )
+        except DatabaseError as ex:
+            logger.warning("Unable to persist annotation cache entry: %s", ex)
+
+    async def aget(self, key):
+        if self.persist:
+            return await sync_to_async(self.get)(key)
+        return await self.memory.aget(key)
+
+    async def aset(self, key, value, prompt_version, model_name):
+        if self.persist:
+            await sync_to_async(self.set)(key, value, prompt_version, model_name)
+        else:
+            await self.memory.aset(key, value)
+
+    def prune(self):
+        """Deletes persisted entries older than the TTL."""
+        cutoff = timezone.now() - timedelta(seconds=self.timeout)
+        return AnnotationSuggestion.objects.filter(created_at__lt=cutoff).delete()[0]
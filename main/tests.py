@@ -1,3 +1,1211 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone as django_timezone
+from django.views import View
+from rest_framework.renderers import JSONRenderer
+
+from main import (
+    documents,
+    events,
+    helper,
+    keygen,
+    metrics,
+    routers,
+    throttling,
+    tokens,
+    webhooks,
+)
+from main.authentication import CachedJWTAuthentication, get_user_cache
+from main.cache import CacheStats, LocalTTLCache
+from main.checks import check_user_cache, check_webhook_caches
+from main.classifier import RULES, classify_text
+from main.conditional import versioned
+from main.middleware import ReplicaRoutingMiddleware
+from main.models import (
+    Annotation,
+    AnnotationComment,
+    AnnotationSuggestion,
+    ArchivedAnnotationComment,
+    ResourceVersion,
+    UserAccount,
+)
+from main.nylas_client import AsyncNylasClient, NylasClient
+from main.renderers import FastJSONRenderer, orjson
+from main.views import AsyncAutoCreateAnnotationView, BulkAnnotationView
+
+
+class NylasClientRetryTests(SimpleTestCase):
+    def make_client(self, **kwargs):
+        return NylasClient("http://nylas.test", "token", backoff_factor=0, **kwargs)
+
+    def test_read_timeout_is_not_retried(self):
+        client = self.make_client()
+        with mock.patch.object(
+            client.session, "request", side_effect=requests.ReadTimeout
+        ) as request:
+            with self.assertRaises(requests.ReadTimeout):
+                client.get_message("abc")
+        self.assertEqual(request.call_count, 1)
+
+    def test_connection_errors_are_retried(self):
+        client = self.make_client(max_retries=2)
+        with mock.patch.object(
+            client.session, "request", side_effect=requests.ConnectionError
+        ) as request:
+            with self.assertRaises(requests.ConnectionError):
+                client.get_message("abc")
+        self.assertEqual(request.call_count, 3)
+
+    def test_no_retry_past_deadline(self):
+        client = self.make_client(deadline=0)
+        throttled = mock.Mock(status_code=429, headers={"Retry-After": "5"})
+        with mock.patch.object(
+            client.session, "request", return_value=throttled
+        ) as request:
+            self.assertIs(client.get_message("abc"), throttled)
+        self.assertEqual(request.call_count, 1)
+
+
+class AsyncNylasClientRetryTests(SimpleTestCase):
+    def response(self, status, body, headers=None):
+        response = mock.AsyncMock(status=status, headers=headers or {})
+        response.read.return_value = body
+        response.__aenter__.return_value = response
+        return response
+
+    async def test_non_json_retry_response_is_retried(self):
+        client = AsyncNylasClient("http://nylas.test", "token", backoff_factor=0)
+        responses = [
+            self.response(503, b"<html>Service Unavailable</html>"),
+            self.response(429, b""),
+            self.response(200, b'{"id": "abc"}'),
+        ]
+        with mock.patch.object(
+            AsyncNylasClient, "session", mock.Mock(request=mock.Mock(side_effect=responses))
+        ):
+            self.assertEqual(await client.get_message("abc"), (200, {"id": "abc"}))
+
+    async def test_exhausted_retries_return_empty_body(self):
+        client = AsyncNylasClient("http://nylas.test", "token", max_retries=0)
+        with mock.patch.object(
+            AsyncNylasClient,
+            "session",
+            mock.Mock(request=mock.Mock(return_value=self.response(503, b"<html>"))),
+        ):
+            self.assertEqual(await client.get_message("abc"), (503, {}))
+
+
+class AsyncAPIAccessTests(TestCase):
+    url = "/api/async/threads/annotation/"
+
+    def setUp(self):
+        store = mock.patch.object(throttling, "_store", throttling.LocalBucketStore())
+        store.start()
+        self.addCleanup(store.stop)
+
+    async def post(self, **kwargs):
+        return await self.async_client.post(
+            self.url, {"texts": ["a"]}, content_type="application/json", **kwargs
+        )
+
+    async def test_event_stream_requires_authentication(self):
+        response = await self.async_client.get(
+            "/api/async/threads/thread-1/events/",
+            headers={"Authorization": "Bearer invalid"},
+        )
+        self.assertEqual(response.status_code, 401)
+
+    @mock.patch("main.views.AsyncThreadEventsView.permission_classes", [])
+    @mock.patch("main.views.AsyncThreadEventsView.authentication_classes", [])
+    def test_event_stream_is_not_served_over_wsgi(self):
+        response = self.client.get("/api/async/threads/thread-1/events/")
+        self.assertEqual(response.status_code, 501)
+
+    async def test_invalid_token_is_rejected(self):
+        response = await self.post(headers={"Authorization": "Bearer invalid"})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()["status"], "failed")
+
+    @mock.patch.object(
+        AsyncAutoCreateAnnotationView,
+        "throttle_classes",
+        [throttling.ScopedRateThrottle],
+    )
+    @mock.patch.object(
+        throttling.ScopedRateThrottle,
+        "THROTTLE_RATES",
+        {"auto_annotate": "1/min"},
+    )
+    @mock.patch(
+        "main.views.aauto_create_annotations",
+        return_value=[{"index": 0, "status": "success", "data": []}],
+    )
+    async def test_auto_annotate_is_throttled(self, annotate):
+        self.assertEqual((await self.post()).status_code, 201)
+        response = await self.post()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertEqual(annotate.call_count, 1)
+
+
+class AutoCreateAnnotationsTests(SimpleTestCase):
+    @mock.patch("main.helper.auto_create_annotation", side_effect=ValueError)
+    def test_exception_without_args_is_reported(self, annotate):
+        self.assertEqual(
+            helper.auto_create_annotations(["a"]),
+            [{"index": 0, "status": "failed", "message": "ValueError"}],
+        )
+
+    @mock.patch("main.helper.auto_create_annotation")
+    def test_calls_wait_for_a_free_slot(self, annotate):
+        with mock.patch.object(helper, "_llm_slots", threading.BoundedSemaphore(1)):
+            helper._llm_slots.acquire()
+            results = helper.auto_create_annotations(["a", "b"], deadline=0.05)
+        self.assertEqual({result["message"] for result in results}, {"Timed out"})
+        annotate.assert_not_called()
+
+
+class ParticipantCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = LocalTTLCache(timeout=300, max_entries=2)
+        patcher = mock.patch.object(helper, "_participant_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_entries_expire(self):
+        with mock.patch("main.cache.time.monotonic", return_value=1000.0):
+            self.cache.set("a", 1, timeout=10)
+        with mock.patch("main.cache.time.monotonic", return_value=1009.0):
+            self.assertEqual(self.cache.get("a"), 1)
+        with mock.patch("main.cache.time.monotonic", return_value=1010.0):
+            self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual((self.cache.get("a"), self.cache.get("c")), (1, 3))
+        self.assertEqual(self.cache.stats.evictions, 1)
+
+    @mock.patch("main.helper._confirm_email_extract", return_value=["ada@example.com"])
+    def test_participants_are_cached(self, extract):
+        for _ in range(2):
+            self.assertEqual(
+                helper.confirm_email_and_participants("thread"), ["ada@example.com"]
+            )
+        extract.assert_called_once_with("thread")
+
+    @mock.patch(
+        "main.helper._confirm_email_extract",
+        side_effect=helper.UnknownEmailError("Email id does not exist"),
+    )
+    def test_unknown_ids_are_cached_briefly(self, extract):
+        for _ in range(2):
+            with self.assertRaisesMessage(
+                helper.UnknownEmailError, "Email id does not exist"
+            ):
+                helper.confirm_email_and_participants("missing")
+        extract.assert_called_once_with("missing")
+        with mock.patch(
+            "main.cache.time.monotonic",
+            return_value=time.monotonic()
+            + settings.PARTICIPANT_CACHE["NEGATIVE_TIMEOUT"],
+        ):
+            with self.assertRaises(helper.UnknownEmailError):
+                helper.confirm_email_and_participants("missing")
+        self.assertEqual(extract.call_count, 2)
+
+
+class ClassifierTests(SimpleTestCase):
+    def labels(self, text):
+        return {result["label"]: result["confidence"] for result in classify_text(text)}
+
+    def test_no_single_rule_reaches_threshold(self):
+        threshold = settings.ANNOTATION_CLASSIFIER["THRESHOLD"]
+        self.assertTrue(all(weight < threshold for _, _, weight in RULES))
+
+    def test_corroborated_match_is_confident(self):
+        labels = self.labels("Just checking in, any updates from your side.")
+        self.assertEqual(list(labels), ["follow-up"])
+        self.assertGreaterEqual(labels["follow-up"], 0.8)
+
+    def test_unrelated_text_has_no_labels(self):
+        self.assertEqual(classify_text("Thanks, talk soon"), [])
+
+    def test_repeated_keyword_is_not_corroboration(self):
+        self.assertLess(self.labels("Sounds good? Really?")["question"], 0.8)
+
+    def test_mixed_labels_are_kept(self):
+        labels = self.labels("Can you send the report by Friday?")
+        self.assertLessEqual({"question", "task", "deadline"}, set(labels))
+        self.assertLess(labels["deadline"], 0.8)
+
+    @mock.patch.dict(settings.ANNOTATION_CLASSIFIER, {"ENABLED": True})
+    def test_uncertain_label_defers_to_llm(self):
+        confident, fallback = helper._classify("Can you send the report by Friday?")
+        self.assertIsNone(confident)
+        self.assertLessEqual(
+            {"Question", "Task", "Deadline"}, {a["Category"] for a in fallback}
+        )
+
+    @mock.patch.dict(settings.ANNOTATION_CLASSIFIER, {"ENABLED": True})
+    def test_all_confident_labels_skip_llm(self):
+        confident, _ = helper._classify("Following up: any updates on this?")
+        self.assertIsNone(confident)
+        confident, _ = helper._classify("Just checking in, any updates from your side.")
+        self.assertEqual([a["Category"] for a in confident], ["Follow-up"])
+
+
+class ThreadDocumentStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def use_store(self, **config):
+        store = documents.ThreadDocumentStore({"ENABLED": True, **config})
+        patcher = mock.patch.object(documents, "_thread_documents", store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return store
+
+    def annotate(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            Annotation.objects.create(
+                email_id="Thread-1",
+                text=text,
+                user_email=f"{text}@example.com",
+                annotation_label="task",
+            )
+
+    def texts(self, store):
+        return sorted(item["text"] for item in store.get("thread-1"))
+
+    def test_write_is_visible_after_commit(self):
+        store = self.use_store()
+        self.annotate("first")
+        self.assertEqual(self.texts(store), ["first"])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Annotation.objects.create(
+                email_id="thread-1",
+                text="second",
+                user_email="second@example.com",
+                annotation_label="task",
+            )
+            # not committed yet, the document is left alone
+            self.assertEqual(self.texts(store), ["first"])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.texts(store), ["first", "second"])
+
+    def test_stale_seconds_serves_previous_document(self):
+        store = self.use_store(STALE_SECONDS=30)
+        self.annotate("first")
+        self.assertEqual(self.texts(store), ["first"])
+
+        self.annotate("second")
+        self.assertEqual(self.texts(store), ["first"])
+        with mock.patch("main.documents.time.time", return_value=time.time() + 31):
+            self.assertEqual(self.texts(store), ["first", "second"])
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def render(self, data):
+        return FastJSONRenderer().render(data), JSONRenderer().render(data)
+
+    def test_matches_json_renderer(self):
+        fast, drf = self.render(
+            {
+                "status": "success",
+                "text": "caf\u00e9 \u2028 \u2029 \U0001f600",
+                "at": datetime(2023, 9, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+                "id": uuid.UUID(int=1),
+                "amount": Decimal("1.50"),
+                "count": 3,
+                "big": 2**70,
+                "items": [None, True, ("a", 1)],
+            }
+        )
+        self.assertEqual(fast, drf)
+
+    def test_floats_keep_their_value(self):
+        values = [0.1, 1.5, 1e16, 1e-7, -2.5e300]
+        fast, drf = self.render(values)
+        self.assertEqual(json.loads(fast), json.loads(drf))
+
+    @skipIf(orjson is None, "orjson is not installed")
+    def test_non_finite_floats_render_as_null(self):
+        self.assertEqual(FastJSONRenderer().render([float("inf")]), b"[null]")
+        with self.assertRaises(ValueError):
+            JSONRenderer().render([float("inf")])
+
+
+class VersionedViewTests(TestCase):
+    class ThreadView(View):
+        @versioned(lambda email_id: ResourceVersion.thread_key(email_id))
+        def get(self, request, email_id):
+            if "fail" in request.GET:
+                return HttpResponse("failed", status=400)
+            return HttpResponse("ok")
+
+    def get(self, path="/threads/a/", **headers):
+        request = RequestFactory().get(path, headers=headers)
+        return self.ThreadView.as_view()(request, email_id="a")
+
+    def test_failures_carry_no_validators(self):
+        response = self.get("/threads/a/?fail=1")
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+
+    def test_unversioned_resource_is_not_written(self):
+        etag = self.get()["ETag"]
+        self.assertTrue(etag.startswith('"0-'))
+        self.assertEqual(self.get(If_None_Match=etag).status_code, 304)
+        self.assertFalse(ResourceVersion.objects.exists())
+
+    def test_write_changes_etag(self):
+        etag = self.get()["ETag"]
+        ResourceVersion.objects.bump([ResourceVersion.thread_key("A")])
+        response = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["ETag"].startswith('"1-'))
+        self.assertIn("Last-Modified", response)
+
+
+@mock.patch(
+    "main.views.confirm_email_and_participants",
+    return_value=["ada@example.com", "bob@example.com"],
+)
+class BulkAnnotationTests(TestCase):
+    url = "/api/threads/thread-1/annotation/bulk/"
+
+    def setUp(self):
+        store = mock.patch.object(throttling, "_store", throttling.LocalBucketStore())
+        store.start()
+        self.addCleanup(store.stop)
+
+    def item(self, user_email, label="task", **kwargs):
+        return {
+            "text": "Send the report",
+            "user_email": user_email,
+            "annotation_label": label,
+            **kwargs,
+        }
+
+    def post(self, items):
+        return self.client.post(
+            self.url, {"annotations": items}, content_type="application/json"
+        )
+
+    def test_results_are_reported_per_item(self, participants):
+        Annotation.objects.create(
+            email_id="thread-1",
+            text="Existing",
+            user_email="bob@example.com",
+            annotation_label="question",
+        )
+        response = self.post(
+            [
+                self.item("ada@example.com"),
+                self.item("eve@example.com"),
+                self.item("ada@example.com", text="Again"),
+                self.item("bob@example.com", label="question"),
+                self.item("bob@example.com", label="unknown"),
+            ]
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()["data"]
+        self.assertEqual((data["created"], data["failed"]), (1, 4))
+        results = data["results"]
+        self.assertEqual([result["index"] for result in results], [0, 1, 2, 3, 4])
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["success", "failed", "failed", "failed", "failed"],
+        )
+        self.assertIn("not a part of this email thread", results[1]["message"])
+        self.assertIn("Duplicate annotation label", results[2]["message"])
+        self.assertIn("already created notes", results[3]["message"])
+        self.assertIn("annotation_label", results[4]["message"])
+        self.assertTrue(Annotation.objects.filter(pk=results[0]["id"]).exists())
+        participants.assert_called_once_with("thread-1")
+
+    def test_all_failed_items_return_bad_request(self, participants):
+        response = self.post([self.item("eve@example.com")])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"][0]["status"], "failed")
+
+    def test_conflicting_insert_is_retried(self, participants):
+        Annotation.objects.create(
+            email_id="thread-1",
+            text="Existing",
+            user_email="ada@example.com",
+            annotation_label="task",
+        )
+        # the first check misses the row, as if it had been written concurrently
+        with mock.patch.object(
+            BulkAnnotationView,
+            "find_conflicts",
+            side_effect=[set(), {("task", "ada@example.com")}],
+        ):
+            response = self.post(
+                [self.item("ada@example.com"), self.item("bob@example.com")]
+            )
+        self.assertEqual(response.status_code, 201)
+        results = response.json()["data"]["results"]
+        self.assertEqual([result["status"] for result in results], ["failed", "success"])
+        self.assertEqual(Annotation.objects.filter(email_id="thread-1").count(), 2)
+
+
+class KeysetPaginationTests(TestCase):
+    url = "/api/threads/thread-1/annotation/"
+
+    def setUp(self):
+        store = mock.patch.object(throttling, "_store", throttling.LocalBucketStore())
+        store.start()
+        self.addCleanup(store.stop)
+        # read from the primary, where the rows of the test transaction are
+        aliases = mock.patch("main.middleware.replica_aliases", return_value=[])
+        aliases.start()
+        self.addCleanup(aliases.stop)
+
+        created_at = django_timezone.now()
+        self.ids = []
+        labels = ["task", "question", "review", "feedback", "approval"]
+        for index, label in enumerate(labels):
+            annotation = Annotation.objects.create(
+                email_id="thread-1",
+                text=f"Annotation {index}",
+                user_email="ada@example.com",
+                annotation_label=label,
+            )
+            # the last three share a timestamp, so the pk breaks the tie
+            Annotation.objects.filter(pk=annotation.pk).update(
+                created_at=created_at - timedelta(seconds=max(2 - index, 0))
+            )
+            self.ids.append(annotation.pk)
+
+    def get(self, url, **params):
+        return self.client.get(url, params)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        expected = list(
+            Annotation.objects.filter(pk__in=self.ids)
+            .order_by("-created_at", "-pk")
+            .values_list("pk", flat=True)
+        )
+        seen = []
+        response = self.get(self.url, pagination="cursor", limit=2)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            page = response.json()["data"]
+            self.assertLessEqual(len(page["results"]), 2)
+            seen.extend(row["id"] for row in page["results"])
+            if page["next"] is None:
+                break
+            response = self.client.get(page["next"])
+        self.assertEqual(seen, expected)
+
+    def test_rows_added_meanwhile_do_not_shift_pages(self):
+        first = self.get(self.url, pagination="cursor", limit=2).json()["data"]
+        Annotation.objects.create(
+            email_id="thread-1",
+            text="Newer",
+            user_email="bob@example.com",
+            annotation_label="task",
+        )
+        second = self.client.get(first["next"]).json()["data"]
+        ids = [row["id"] for row in first["results"] + second["results"]]
+        self.assertEqual(len(set(ids)), 4)
+        self.assertLessEqual(set(ids), set(self.ids))
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in (
+            "not-base64!",
+            base64.urlsafe_b64encode(b"[1, 2]").decode(),
+            base64.urlsafe_b64encode(b'{"t": "yesterday", "k": "a"}').decode(),
+            base64.urlsafe_b64encode(b'{"k": "a"}').decode(),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.get(self.url, cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["message"], "Invalid cursor")
+
+    def test_offset_pagination_is_kept_by_default(self):
+        response = self.get(self.url, user_email="ada@example.com", limit=2, offset=4)
+        self.assertEqual(response.status_code, 200)
+        page = response.json()["data"]
+        self.assertEqual(page["count"], 5)
+        self.assertEqual(len(page["results"]), 1)
+
+
+class ThreadOverviewTests(TestCase):
+    url = "/api/threads/thread-1/overview/"
+
+    def setUp(self):
+        store = mock.patch.object(throttling, "_store", throttling.LocalBucketStore())
+        store.start()
+        self.addCleanup(store.stop)
+        # read from the primary, where the rows of the test transaction are
+        aliases = mock.patch("main.middleware.replica_aliases", return_value=[])
+        aliases.start()
+        self.addCleanup(aliases.stop)
+
+        self.busy, self.quiet, deleted = (
+            Annotation.objects.create(
+                email_id="thread-1",
+                text=f"Annotation {label}",
+                user_email="ada@example.com",
+                annotation_label=label,
+                is_deleted=label == "review",
+            )
+            for label in ("task", "question", "review")
+        )
+        created_at = django_timezone.now()
+        self.comments = []
+        for index in range(5):
+            comment = AnnotationComment.objects.create(
+                comment=f"Comment {index}",
+                author_email="bob@example.com",
+                annotation=self.busy,
+                is_deleted=index == 4,
+            )
+            AnnotationComment.objects.filter(pk=comment.pk).update(
+                created_at=created_at + timedelta(seconds=index)
+            )
+            self.comments.append(comment.pk)
+        AnnotationComment.objects.create(
+            comment="On a deleted annotation",
+            author_email="bob@example.com",
+            annotation=deleted,
+        )
+
+    def overview(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {row["id"]: row for row in response.json()["data"]}
+
+    def test_live_comments_are_counted_and_newest_listed(self):
+        overview = self.overview(comments=2)
+        self.assertEqual(set(overview), {self.busy.pk, self.quiet.pk})
+        busy = overview[self.busy.pk]
+        self.assertEqual(busy["comment_count"], 4)
+        self.assertEqual(
+            [comment["id"] for comment in busy["latest_comments"]],
+            [self.comments[3], self.comments[2]],
+        )
+        self.assertEqual(overview[self.quiet.pk]["comment_count"], 0)
+        self.assertEqual(overview[self.quiet.pk]["latest_comments"], [])
+
+    def test_default_limit_matches_the_thread_document(self):
+        busy = self.overview()[self.busy.pk]
+        self.assertEqual(
+            len(busy["latest_comments"]), settings.THREAD_OVERVIEW["COMMENTS"]
+        )
+        self.assertEqual(busy["comment_count"], 4)
+
+    def test_summary_loads_in_two_queries(self):
+        with self.assertNumQueries(2):
+            annotations = list(
+                Annotation.objects.for_thread("thread-1").with_comment_summary(latest=2)
+            )
+        self.assertEqual(len(annotations), 3)
+
+    def test_invalid_comment_limit_is_rejected(self):
+        response = self.client.get(self.url, {"comments": "many"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "comments must be a number")
+
+
+class ThreadAnnotationBatchTests(TestCase):
+    url = "/api/threads/annotations/"
+
+    def setUp(self):
+        store = mock.patch.object(throttling, "_store", throttling.LocalBucketStore())
+        store.start()
+        self.addCleanup(store.stop)
+        # read from the primary, where the rows of the test transaction are
+        aliases = mock.patch("main.middleware.replica_aliases", return_value=[])
+        aliases.start()
+        self.addCleanup(aliases.stop)
+
+        created_at = django_timezone.now()
+        self.ids = {}
+        rows = [
+            ("Thread-A", "task", False),
+            ("Thread-A", "question", False),
+            ("Thread-A", "review", False),
+            ("thread-b", "task", True),
+            ("thread-b", "question", False),
+        ]
+        for index, (email_id, label, is_deleted) in enumerate(rows):
+            annotation = Annotation.objects.create(
+                email_id=email_id,
+                text=f"Annotation {index}",
+                user_email="ada@example.com",
+                annotation_label=label,
+                is_deleted=is_deleted,
+            )
+            Annotation.objects.filter(pk=annotation.pk).update(
+                created_at=created_at + timedelta(seconds=index)
+            )
+            self.ids.setdefault(email_id.lower(), []).append(annotation.pk)
+
+    def get(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_annotations_are_grouped_per_requested_thread(self):
+        response = self.get(email_ids=["thread-a,THREAD-B", "thread-c"], limit=2)
+        self.assertEqual(response.status_code, 200)
+        threads = response.json()["data"]
+        self.assertEqual(list(threads), ["thread-a", "THREAD-B", "thread-c"])
+        self.assertEqual(
+            [row["id"] for row in threads["thread-a"]], self.ids["thread-a"][::-1][:2]
+        )
+        self.assertEqual(
+            [row["id"] for row in threads["THREAD-B"]], self.ids["thread-b"][1:]
+        )
+        self.assertEqual(threads["thread-c"], [])
+
+    def test_repeated_ids_are_returned_once(self):
+        threads = self.get(email_ids="thread-a, thread-a,").json()["data"]
+        self.assertEqual(list(threads), ["thread-a"])
+        self.assertEqual(len(threads["thread-a"]), 3)
+
+    def test_threads_load_in_one_query(self):
+        with self.assertNumQueries(1):
+            rows = list(
+                Annotation.objects.for_threads(["thread-a", "thread-b"])
+                .filter(is_deleted=False)
+                .latest_per_thread(1)
+            )
+        self.assertEqual(
+            {row.email_key: row.pk for row in rows},
+            {"thread-a": self.ids["thread-a"][-1], "thread-b": self.ids["thread-b"][1]},
+        )
+
+    def test_invalid_requests_are_rejected(self):
+        with self.settings(THREAD_BATCH={**settings.THREAD_BATCH, "MAX_THREADS": 2}):
+            for params, message in (
+                ({}, "email_ids is required"),
+                ({"email_ids": " , "}, "email_ids is required"),
+                ({"email_ids": "a,b,c"}, "Cannot fetch more than 2 threads at once"),
+                ({"email_ids": "a", "limit": "all"}, "limit must be a number"),
+            ):
+                with self.subTest(params=params):
+                    response = self.get(**params)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json()["message"], message)
+
+
+class KeyAllocatorTests(TransactionTestCase):
+    def test_keys_are_fixed_length_and_distinct(self):
+        keys = {keygen.encode_key(number) for number in range(10_000)}
+        self.assertEqual(len(keys), 10_000)
+        self.assertTrue(all(len(key) == keygen.KEY_LENGTH for key in keys))
+
+    def test_existing_keys_are_skipped(self):
+        allocator = keygen.KeyAllocator(Annotation, "test-existing", block_size=5)
+        Annotation.objects.create(
+            id=keygen.encode_key(2),
+            email_id="thread-1",
+            text="Legacy id",
+            user_email="ada@example.com",
+            annotation_label="task",
+        )
+        self.assertNotIn(keygen.encode_key(2), allocator.allocate(5))
+
+    def test_concurrent_allocators_never_share_keys(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            # shared-cache in-memory databases fail instead of waiting on locks
+            self.skipTest("needs a database that waits for concurrent writers")
+        # one allocator per "process", each shared by several threads
+        allocators = [
+            keygen.KeyAllocator(Annotation, "test-stress", block_size=7)
+            for _ in range(3)
+        ]
+        keys = []
+        lock = threading.Lock()
+
+        def allocate(allocator):
+            try:
+                for _ in range(20):
+                    allocated = allocator.allocate(3)
+                    with lock:
+                        keys.extend(allocated)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=allocate, args=(allocator,))
+            for allocator in allocators
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(keys), 3 * 4 * 20 * 3)
+        self.assertEqual(len(set(keys)), len(keys))
+
+
+class ArchiveDeletedTests(TestCase):
+    def setUp(self):
+        self.annotation = Annotation.objects.create(
+            email_id="thread-1",
+            text="text",
+            user_email="user@example.com",
+            annotation_label="task",
+        )
+        self.key = ResourceVersion.annotation_key(self.annotation.pk)
+
+    def archive(self):
+        call_command("archive_deleted", retention_days=0, sleep=0, stdout=io.StringIO())
+
+    def delete_comment(self):
+        comment = AnnotationComment.objects.create(
+            comment="comment", author_email="user@example.com", annotation=self.annotation
+        )
+        comment.is_deleted = True
+        comment.save()
+        return comment
+
+    def test_versions_survive_archiving(self):
+        self.annotation.is_deleted = True
+        self.annotation.save()
+        version = ResourceVersion.objects.current(self.key)[0]
+
+        self.archive()
+
+        self.assertFalse(Annotation.objects.filter(pk=self.annotation.pk).exists())
+        self.assertGreater(ResourceVersion.objects.current(self.key)[0], version)
+
+    def test_archiving_comments_bumps_their_annotation(self):
+        comment = self.delete_comment()
+        version = ResourceVersion.objects.current(self.key)[0]
+
+        self.archive()
+
+        self.assertTrue(ArchivedAnnotationComment.objects.filter(pk=comment.pk).exists())
+        self.assertGreater(ResourceVersion.objects.current(self.key)[0], version)
+
+    def test_conflicting_archive_rows_keep_the_live_row(self):
+        comment = self.delete_comment()
+        ArchivedAnnotationComment.objects.create(
+            id=comment.pk,
+            comment="other",
+            author_email="user@example.com",
+            annotation_id=self.annotation.pk,
+            created_at=comment.created_at,
+            updated_at=comment.updated_at,
+            is_deleted=True,
+        )
+
+        with self.assertRaises(IntegrityError):
+            self.archive()
+        self.assertTrue(AnnotationComment.objects.filter(pk=comment.pk).exists())
+
+
+class InMemoryBrokerTests(SimpleTestCase):
+    def test_idle_threads_are_evicted(self):
+        broker = events.InMemoryBroker(history_ttl=60)
+        broker.publish("old", "annotation.created", {})
+        with mock.patch("main.events.time.monotonic", return_value=time.monotonic() + 61):
+            broker.publish("new", "annotation.created", {})
+        self.assertEqual(list(broker._threads), ["new"])
+
+    def test_least_recent_threads_are_evicted(self):
+        broker = events.InMemoryBroker(max_threads=2)
+        for thread in ["a", "b", "a", "c"]:
+            broker.publish(thread, "annotation.created", {})
+        self.assertEqual(list(broker._threads), ["a", "c"])
+
+    async def test_subscribed_threads_are_kept(self):
+        broker = events.InMemoryBroker(max_threads=1)
+        broker.publish("a", "annotation.created", {})
+        subscription, _, _ = broker.subscribe("a")
+        broker.publish("b", "annotation.created", {})
+        self.assertEqual(list(broker._threads), ["b", "a"])
+
+        broker.unsubscribe(subscription)
+        _, missed, gap = broker.subscribe("a", last_event_id=0)
+        self.assertEqual([event.id for event in missed], [1])
+        self.assertFalse(gap)
+
+    async def test_stream_ends_after_max_duration(self):
+        broker = events.InMemoryBroker()
+        config = {**settings.EVENT_STREAM, "HEARTBEAT": 0.01, "MAX_DURATION": 0.05}
+        with mock.patch.object(events, "_broker", broker), self.settings(
+            EVENT_STREAM=config
+        ):
+            chunks = [chunk async for chunk in events.stream_events("a")]
+        self.assertTrue(chunks[0].startswith("retry:"))
+        self.assertFalse(broker._subscribers)
+
+
+class WebhookSubmitTests(SimpleTestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        patcher = mock.patch.object(
+            webhooks, "process_delta", side_effect=lambda delta: self.release.wait(5)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(webhooks.flush, 5)
+        self.addCleanup(self.release.set)
+
+    def test_flush_waits_for_submitted_deltas(self):
+        webhooks.submit([{"type": "message.created"}] * 3)
+        self.assertFalse(webhooks.flush(timeout=0.01))
+        self.release.set()
+        self.assertTrue(webhooks.flush(timeout=5))
+
+    def test_flush_runs_alongside_concurrent_submits(self):
+        self.release.set()
+        errors = []
+
+        def submit():
+            try:
+                for _ in range(50):
+                    webhooks.submit([{"type": "message.created"}])
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            webhooks.flush(timeout=0.01)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(webhooks.flush(timeout=5))
+
+
+class MetricsViewTests(SimpleTestCase):
+    def test_metrics_are_served(self):
+        with self.settings(METRICS={"ENABLED": True, "TOKEN": "secret"}):
+            self.assertEqual(self.client.get("/metrics/").status_code, 401)
+            response = self.client.get(
+                "/metrics/", headers={"Authorization": "Bearer secret"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE http_request_duration_seconds histogram", response.content)
+
+    def test_cache_counters_are_exported(self):
+        stats = CacheStats()
+        stats.record(True)
+        stats.record(False)
+        stats.record(False)
+        counters = metrics.CacheCounters("app_cache")
+        counters.register("participants", stats)
+        lines = counters.collect()
+        self.assertIn('app_cache_hits_total{cache="participants"} 1', lines)
+        self.assertIn('app_cache_misses_total{cache="participants"} 2', lines)
+
+    def test_built_caches_are_registered(self):
+        with mock.patch.object(helper, "_participant_cache", None):
+            cache = helper.get_participant_cache()
+            cache.get("missing")
+            self.assertIn(
+                'app_cache_misses_total{cache="participants"} %d' % cache.stats.misses,
+                metrics.render_metrics(),
+            )
+
+
+class PruneSuggestionsTests(TestCase):
+    def test_only_expired_suggestions_are_deleted(self):
+        timeout = settings.ANNOTATION_CACHE["TIMEOUT"]
+        for key, age in (("old", timeout + 60), ("new", 0)):
+            AnnotationSuggestion.objects.create(
+                key=key,
+                result=[],
+                prompt_version="v1",
+                model_name="test",
+                created_at=django_timezone.now() - timedelta(seconds=age),
+            )
+        out = io.StringIO()
+        call_command("prune_suggestions", stdout=out)
+        self.assertEqual(
+            list(AnnotationSuggestion.objects.values_list("key", flat=True)), ["new"]
+        )
+        self.assertIn("Deleted 1 expired", out.getvalue())
+
+
+class WebhookCacheCheckTests(SimpleTestCase):
+    redis = {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": ""}
+
+    def check(self, backend, caches=None, secret="secret"):
+        with self.settings(
+            NYLAS_WEBHOOK={**settings.NYLAS_WEBHOOK, "SECRET": secret},
+            PARTICIPANT_CACHE={**settings.PARTICIPANT_CACHE, "BACKEND": backend},
+            CACHES=caches or settings.CACHES,
+        ):
+            return [warning.id for warning in check_webhook_caches(None)]
+
+    def test_local_participant_cache_warns(self):
+        self.assertEqual(self.check("local"), ["main.W001"])
+        self.assertEqual(self.check("django"), ["main.W001"])
+        self.assertEqual(self.check("local", secret=""), [])
+
+    def test_shared_participant_cache_passes(self):
+        self.assertEqual(self.check("django", {"default": self.redis}), [])
+
+
+class UserCacheCheckTests(SimpleTestCase):
+    def check(self, timeout, caches=None):
+        with self.settings(
+            AUTH_USER_CACHE={**settings.AUTH_USER_CACHE, "TIMEOUT": timeout},
+            CACHES=caches or settings.CACHES,
+        ):
+            return [warning.id for warning in check_user_cache(None)]
+
+    def test_long_timeout_needs_a_shared_cache(self):
+        self.assertEqual(self.check(300), ["main.W002"])
+        self.assertEqual(self.check(5), [])
+        self.assertEqual(
+            self.check(300, {"default": WebhookCacheCheckTests.redis}), []
+        )
+
+
+class TokenRefreshTests(TestCase):
+    def setUp(self):
+        blacklist = mock.patch.object(tokens, "_blacklist_filter", None)
+        blacklist.start()
+        self.addCleanup(blacklist.stop)
+        user = UserAccount(
+            email="user@example.com", first_name="Ada", last_name="Lovelace", is_active=True
+        )
+        user.set_password("password")
+        user.save()
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type="application/json")
+
+    def test_refresh_rotates_and_blacklists(self):
+        refresh = self.post(
+            "/api/auth/token/", {"email": "user@example.com", "password": "password"}
+        ).json()["refresh"]
+
+        response = self.post("/api/auth/token/refresh/", {"refresh": refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.json())
+        self.assertNotEqual(response.json()["refresh"], refresh)
+
+        reused = self.post("/api/auth/token/refresh/", {"refresh": refresh})
+        self.assertEqual(reused.status_code, 401)
+
+    def test_other_workers_catch_up_on_sync(self):
+        refresh = tokens.BloomRefreshToken.for_user(UserAccount.objects.get())
+        other_worker = tokens.BlacklistFilter(
+            {**settings.TOKEN_BLACKLIST, "SYNC_INTERVAL": 0}
+        )
+        other_worker.refresh()
+        refresh.blacklist()
+        self.assertIn(refresh["jti"], other_worker)
+
+
+class LaggingReplicaTests(TestCase):
+    """
+    Runs against a SQLite "lagging_replica" alias that never receives the writes
+    made on "default", i.e. a replica that has not caught up yet.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # added after the test case guards its databases: nothing writes to it
+        fd, cls.replica_path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        connections.settings["lagging_replica"] = {
+            **connections["default"].settings_dict,
+            "NAME": cls.replica_path,
+        }
+        with connections["lagging_replica"].schema_editor() as editor:
+            for model in [Annotation, AnnotationComment, ResourceVersion]:
+                editor.create_model(model)
+        for module in ["main.routers", "main.middleware"]:
+            aliases = mock.patch(
+                f"{module}.replica_aliases", return_value=["lagging_replica"]
+            )
+            aliases.start()
+            cls.addClassCleanup(aliases.stop)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["lagging_replica"].close()
+        del connections.settings["lagging_replica"]
+        del connections._connections.lagging_replica
+        os.remove(cls.replica_path)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def annotate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Annotation.objects.create(
+                email_id="thread-1",
+                text="text",
+                user_email="user@example.com",
+                annotation_label="task",
+            )
+
+    def thread_view(self, request):
+        if request.method == "POST":
+            self.annotate()
+            return HttpResponse(status=201)
+        texts = Annotation.objects.for_thread("thread-1").values_list("text", flat=True)
+        return HttpResponse(",".join(texts))
+
+    def test_client_reads_its_own_write(self):
+        middleware = ReplicaRoutingMiddleware(self.thread_view)
+        factory = RequestFactory()
+        written = middleware(factory.post("/"))
+        header = settings.READ_REPLICA["HEADER"]
+
+        self.assertEqual(middleware(factory.get("/")).content, b"")
+        response = middleware(factory.get("/", headers={header: written[header]}))
+        self.assertEqual(response.content, b"text")
+
+    def test_replica_reader_cannot_poison_document(self):
+        store = documents.ThreadDocumentStore({"ENABLED": True})
+        with mock.patch.object(documents, "_thread_documents", store):
+            self.annotate()
+            token = routers.use_replica()
+            try:
+                self.assertEqual(len(store.get("thread-1")), 1)
+            finally:
+                routers.reset(token)
+        self.assertEqual(len(store.get("thread-1")), 1)
+
+    def test_document_is_never_older_than_version(self):
+        store = documents.ThreadDocumentStore({"ENABLED": True, "STALE_SECONDS": 30})
+        with mock.patch.object(documents, "_thread_documents", store):
+            self.assertEqual(store.get("thread-1"), [])
+            self.annotate()
+            # within STALE_SECONDS, unless the caller saw the newer version
+            self.assertEqual(store.get("thread-1"), [])
+            version, _ = ResourceVersion.objects.current(
+                ResourceVersion.thread_key("thread-1")
+            )
+            self.assertEqual(len(store.get("thread-1", version)), 1)
+
+
+class BucketStoreTests:
+    """GCRA behaviour every bucket store must have; 3 requests per 30s."""
+
+    interval, window = 10.0, 30.0
+
+    def consume(self, key="user", now=1000.0):
+        return self.store.consume(key, self.interval, self.window, now)
+
+    def test_burst_then_one_per_interval(self):
+        self.assertEqual([self.consume() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(self.consume(), 10)
+        self.assertAlmostEqual(self.consume(now=1005.0), 5)
+        self.assertEqual(self.consume(now=1010.0), 0)
+        self.assertAlmostEqual(self.consume(now=1010.0), 10)
+
+    def test_refused_requests_take_nothing(self):
+        for _ in range(10):
+            self.consume()
+        self.assertEqual(self.consume(now=1010.0), 0)
+
+    def test_drained_bucket_allows_a_full_burst(self):
+        for _ in range(3):
+            self.consume()
+        self.assertEqual([self.consume(now=1100.0) for _ in range(3)], [0, 0, 0])
+        self.assertGreater(self.consume(now=1100.0), 0)
+
+    def test_keys_are_independent(self):
+        for _ in range(3):
+            self.consume("a")
+        self.assertGreater(self.consume("a"), 0)
+        self.assertEqual(self.consume("b"), 0)
+
+
+class LocalBucketStoreTests(BucketStoreTests, SimpleTestCase):
+    def setUp(self):
+        self.store = throttling.LocalBucketStore()
+
+
+class CacheBucketStoreTests(BucketStoreTests, SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.store = throttling.CacheBucketStore("default")
+
+
+class DatabaseBucketStoreTests(BucketStoreTests, TestCase):
+    def setUp(self):
+        self.store = throttling.DatabaseBucketStore()
+
+
+class GCRARateThrottleTests(SimpleTestCase):
+    def setUp(self):
+        store = mock.patch.object(throttling, "_store", throttling.LocalBucketStore())
+        store.start()
+        self.addCleanup(store.stop)
+
+    @mock.patch.object(throttling.AnonRateThrottle, "THROTTLE_RATES", {"anon": "2/min"})
+    def test_rate_allows_burst_then_waits(self):
+        request = RequestFactory().get("/")
+        request.user = mock.Mock(is_authenticated=False)
+        throttle = throttling.AnonRateThrottle()
+        with mock.patch.object(throttle, "timer", return_value=1000.0):
+            allowed = [throttle.allow_request(request, None) for _ in range(3)]
+        self.assertEqual(allowed, [True, True, False])
+        self.assertAlmostEqual(throttle.wait(), 30)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = UserAccount.objects.create(
+            email="user@example.com", first_name="Ada", last_name="Lovelace", is_active=True
+        )
+        get_user_cache().delete(str(self.user.pk))
+        self.addCleanup(get_user_cache().delete, str(self.user.pk))
+
+    @mock.patch("main.routers.replica_aliases", return_value=["missing_replica"])
+    def test_misses_are_loaded_from_the_primary(self, aliases):
+        token = tokens.BloomRefreshToken.for_user(self.user).access_token
+        read_alias = routers.use_replica()
+        try:
+            # querying the unknown replica alias would raise
+            user = CachedJWTAuthentication().get_user(token)
+        finally:
+            routers.reset(read_alias)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(get_user_cache().get(str(self.user.pk)).pk, self.user.pk)
+
+    def test_saving_the_user_drops_the_cached_one(self):
+        token = tokens.BloomRefreshToken.for_user(self.user).access_token
+        CachedJWTAuthentication().get_user(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(get_user_cache().get(str(self.user.pk)))
@@ -0,0 +1,152 @@
+import hashlib
+import math
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+
+_store = None
+
+
+class LocalBucketStore:
+    """
+    In-process GCRA buckets for tests and single-process development. Limits
+    are not shared between workers.
+
+    Args:
+        max_entries (int): Buckets kept before drained ones are dropped.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._tats = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, interval, window, now):
+        with self._lock:
+            start = max(self._tats.get(key, now), now)
+            if start + interval - now > window:
+                return start + interval - now - window
+            self._tats[key] = start + interval
+            if len(self._tats) > self.max_entries:
+                self._tats = {k: tat for k, tat in self._tats.items() if tat > now}
+            return 0.0
+
+    def clear(self):
+        with self._lock:
+            self._tats.clear()
+
+
+class CacheBucketStore:
+    """
+    GCRA buckets in a Django cache shared by every worker (Redis,
+    Memcached), `CACHES[THROTTLE["CACHE_ALIAS"]]`. The arrival time of each
+    key is kept in milliseconds and advanced with the atomic `incr`, and
+    taken back with `decr` when the request is refused.
+
+    A bucket that drained while two requests raced to restart it may let
+    one extra request through.
+
+    Args:
+        alias (str): Cache alias, `THROTTLE["CACHE_ALIAS"]` by default.
+    """
+
+    def __init__(self, alias=None):
+        self.alias = alias or settings.THROTTLE["CACHE_ALIAS"]
+
+    def consume(self, key, interval, window, now):
+        cache = caches[self.alias]
+        key = f"throttle:{key}"
+        step, now_ms, window_ms = (round(value * 1000) for value in (interval, now, window))
+        # a bucket holds at most `window` seconds, so it drains before expiring
+        timeout = math.ceil(window) + 1
+
+        cache.add(key, now_ms, timeout)
+        try:
+            tat = cache.incr(key, step)
+        except ValueError:  # expired between add and incr
+            cache.add(key, now_ms + step, timeout)
+            return 0.0
+        if tat < now_ms + step:
+            # the bucket had drained, start it again from now
+            cache.set(key, now_ms + step, timeout)
+            return 0.0
+        if tat - now_ms > window_ms:
+            cache.decr(key, step)
+            return (tat - now_ms - window_ms) / 1000
+        cache.touch(key, timeout)
+        return 0.0
+
+
+class DatabaseBucketStore:
+    """
+    GCRA buckets in the `ThrottleBucket` table, shared by every worker and
+    node. Each check is one atomic upsert of a single row per key, on the
+    primary, even for reads served from replicas; prefer `CacheBucketStore`
+    and keep this one for deployments without a shared cache.
+    """
+
+    def consume(self, key, interval, window, now):
+        from main.models import ThrottleBucket
+
+        return ThrottleBucket.objects.consume(key, interval, window, now)
+
+    def clear(self):
+        from main.models import ThrottleBucket
+
+        ThrottleBucket.objects.all().delete()
+
+
+def get_bucket_store():
+    """
+    Returns the process-wide bucket store named by `settings.THROTTLE["STORE"]`.
+    """
+    global _store
+    if _store is None:
+        _store = import_string(settings.THROTTLE["STORE"])()
+    return _store
+
+
+class GCRARateThrottle(throttling.SimpleRateThrottle):
+    """
+    `SimpleRateThrottle` that keeps a GCRA (token bucket) state per key in
+    the shared bucket store instead of a list of request times in the local
+    cache. A rate of "150/day" still allows bursts of 150 requests, then one
+    more every 1/150th of a day.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        if len(self.key) > 255:
+            self.key = hashlib.sha1(self.key.encode()).hexdigest()
+
+        interval = self.duration / self.num_requests
+        self.retry_after = get_bucket_store().consume(
+            self.key, interval, self.duration, self.timer()
+        )
+        return self.retry_after == 0
+
+    def wait(self):
+        return self.retry_after
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, GCRARateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, GCRARateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, GCRARateThrottle):
+    """
+    Gives views with a `throttle_scope` their own bucket per user (or IP),
+    limited by that scope's rate, on top of the global anon/user buckets.
+    """
@@ -0,0 +1,153 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+_blacklist_filter = None
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings: `in` never misses an added item,
+    and wrongly matches other items at about `error_rate` once `capacity`
+    items are added.
+
+    Args:
+        capacity (int): Number of items the filter is sized for.
+        error_rate (float): Target false positive rate at capacity.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.size = max(
+            8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))
+        )
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        # double hashing: k positions from two 64-bit halves of one digest
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class BlacklistFilter:
+    """
+    Per-process Bloom filter of blacklisted refresh token ids, so checking a
+    token that was never blacklisted, the common case, needs no query.
+
+    New blacklist rows are pulled at most every `SYNC_INTERVAL` seconds,
+    overlapping the previous pull by `SYNC_OVERLAP` seconds to catch rows
+    committed late. The filter is rebuilt from unexpired rows every
+    `REBUILD_INTERVAL` seconds, or once it outgrows its capacity, which
+    also forgets pruned tokens.
+
+    Args:
+        config (dict): `settings.TOKEN_BLACKLIST`.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._filter = None
+        self._built_at = 0
+        self._synced_at = 0
+        self._synced_until = None
+
+    def rebuild(self):
+        now = timezone.now()
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+        bloom = BloomFilter(
+            max(self.config["CAPACITY"], 2 * rows.count()), self.config["ERROR_RATE"]
+        )
+        for jti in rows.values_list("token__jti", flat=True).iterator():
+            bloom.add(jti)
+        self._filter = bloom
+        self._built_at = self._synced_at = time.monotonic()
+        self._synced_until = now
+
+    def sync(self):
+        now = timezone.now()
+        since = self._synced_until - timedelta(seconds=self.config["SYNC_OVERLAP"])
+        for jti in BlacklistedToken.objects.filter(
+            blacklisted_at__gte=since
+        ).values_list("token__jti", flat=True):
+            self._filter.add(jti)
+        self._synced_at = time.monotonic()
+        self._synced_until = now
+
+    def refresh(self):
+        current = time.monotonic()
+        with self._lock:
+            if (
+                self._filter is None
+                or current - self._built_at >= self.config["REBUILD_INTERVAL"]
+                or self._filter.count > self._filter.capacity
+            ):
+                self.rebuild()
+            elif current - self._synced_at >= self.config["SYNC_INTERVAL"]:
+                self.sync()
+
+    def add(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def __contains__(self, jti):
+        self.refresh()
+        return jti in self._filter
+
+
+def get_blacklist_filter():
+    """
+    Returns the process-wide `BlacklistFilter`, configured by
+    `settings.TOKEN_BLACKLIST`.
+    """
+    global _blacklist_filter
+    if _blacklist_filter is None:
+        _blacklist_filter = BlacklistFilter(settings.TOKEN_BLACKLIST)
+    return _blacklist_filter
+
+
+class BloomRefreshToken(RefreshToken):
+    """
+    `RefreshToken` that only queries the blacklist table for tokens the
+    process Bloom filter may contain, i.e. blacklisted ones and the rare
+    false positive.
+
+    A token rotated (blacklisted) by one worker is still accepted by the
+    others until their next sync, at most `SYNC_INTERVAL` seconds later, so
+    a copy of it can be exchanged once more in that window. Lower
+    `SYNC_INTERVAL` to narrow it, or set it to 0 to sync before every check.
+    """
+
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in get_blacklist_filter():
+            super().check_blacklist()
+
+    def blacklist(self):
+        blacklisted = super().blacklist()
+        # visible to this process right away, other ones catch up on sync
+        get_blacklist_filter().add(self.payload[api_settings.JTI_CLAIM])
+        return blacklisted
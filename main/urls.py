@@ -1,17 +1,36 @@
 from django.urls import path
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from main.views import (
     AnnotationCommentDetailView,
     AnnotationCommentView,
+    AsyncAnnotationCommentView,
+    AsyncAutoCreateAnnotationView,
+    AsyncRetrieveAnnotationView,
+    AsyncThreadEventsView,
     AutoCreateAnnotationView,
+    BulkAnnotationView,
+    CustomTokenView,
+    NylasWebhookView,
     RetrieveAnnotationDetailView,
     RetrieveAnnotationView,
+    ThreadAnnotationBatchView,
+    ThreadOverviewView,
 )
 
 app_name = "main"
 
 urlpatterns = [
+    path("auth/token/", CustomTokenView.as_view()),
+    # rotates the refresh token through SIMPLE_JWT["TOKEN_REFRESH_SERIALIZER"]
+    path("auth/token/refresh/", TokenRefreshView.as_view()),
+    path("threads/annotations/", ThreadAnnotationBatchView.as_view()),
     path("threads/<str:email_id>/annotation/", RetrieveAnnotationView.as_view()),
+    path(
+        "threads/<str:email_id>/annotation/bulk/",
+        BulkAnnotationView.as_view(),
+    ),
+    path("threads/<str:email_id>/overview/", ThreadOverviewView.as_view()),
     path(
         "threads/<str:email_id>/annotation/<str:annotation_id>/",
         RetrieveAnnotationDetailView.as_view(),
@@ -28,4 +47,22 @@ urlpatterns = [
         "threads/annotation/",
         AutoCreateAnnotationView.as_view(),
     ),
+    path("webhooks/nylas/", NylasWebhookView.as_view()),
+    # async variants, served without blocking when running under ASGI
+    path(
+        "async/threads/<str:email_id>/annotation/",
+        AsyncRetrieveAnnotationView.as_view(),
+    ),
+    path(
+        "async/threads/<str:email_id>/events/",
+        AsyncThreadEventsView.as_view(),
+    ),
+    path(
+        "async/threads/annotation/<str:annotation_id>/comment/",
+        AsyncAnnotationCommentView.as_view(),
+    ),
+    path(
+        "async/threads/annotation/",
+        AsyncAutoCreateAnnotationView.as_view(),
+    ),
 ]
@@ -1,16 +1,51 @@
+import json
+import math
+from hmac import compare_digest
 from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
-from main.helper import auto_create_annotation, confirm_email_and_participants
-from main.models import Annotation, AnnotationComment
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from main.conditional import current_version, versioned
+from main.documents import annotation_rows, get_thread_documents
+from main.events import publish_on_commit, stream_events
+from main.filters import AnnotationSearchFilter
+from main.helper import (
+    aauto_create_annotation,
+    aauto_create_annotations,
+    aconfirm_email_and_participants,
+    auto_create_annotation,
+    auto_create_annotations,
+    confirm_email_and_participants,
+)
+from main.metrics import render_metrics
+from main.models import (
+    Annotation,
+    AnnotationComment,
+    ResourceVersion,
+    normalize_email_id,
+)
+from main.pagination import CursorOrOffsetPagination
+from main.renderers import FastJSONRenderer
+from main.signals import record_changes
+from main.webhooks import submit, verify_signature
 from main.serializer import (
     AnnotationCommentDetailSerializer,
     AnnotationCommentSerializer,
+    AnnotationCommentValuesSerializer,
+    AnnotationValuesSerializer,
     CustomTokenSerializer,
     RegistrationSerializer,
     RetrieveAnnotationSerializer,
+    ThreadOverviewSerializer,
 )
 from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, Throttled, ValidationError
 from rest_framework.generics import (
     CreateAPIView,
     ListAPIView,
@@ -19,10 +54,10 @@ from rest_framework.generics import (
 )
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt import views as jwt_views
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 import logging
-from rest_framework import filters
 from rest_framework.views import APIView
 from datetime import timezone
 from django_filters.rest_framework import DjangoFilterBackend
@@ -36,7 +71,7 @@ class CustomAPIResponse:
         self.status_code = status_code
         self.status = status
 
-    def send(self) -> Response:
+    def build(self) -> dict:
         if not all([self.message, self.status_code, self.status]):
             raise ValidationError("message and status code cannot be empty")
 
@@ -48,9 +83,55 @@ class CustomAPIResponse:
                 data["message"] = self.message
         else:
             data["data"] = self.message
-        status_code = self.status_code
+        return data
+
+    def send(self) -> Response:
+        return Response(self.build(), status=self.status_code)
+
+    def send_json(self) -> HttpResponse:
+        """
+        Renders the same envelope as `send` for plain (async) Django views,
+        which bypass DRF content negotiation.
+        """
+        return HttpResponse(
+            FastJSONRenderer().render(self.build()),
+            status=self.status_code,
+            content_type="application/json",
+        )
+
+
+def parse_json_body(request) -> dict:
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError as ex:
+        raise ValidationError("Request body must be valid JSON") from ex
+    if not isinstance(data, dict):
+        raise ValidationError("Request body must be a JSON object")
+    return data
+
+
+def get_batch_texts(data):
+    """
+    Returns the list of texts of a batch auto-annotation request, or None
+    when the request carries a single "text"
+    """
+    if "texts" not in data:
+        if "text" not in data:
+            raise ValidationError("Text is required")
+        return None
+
+    texts = data.get("texts")
+    if not isinstance(texts, list) or not texts:
+        raise ValidationError("Texts must be a non-empty list")
+    max_texts = settings.AUTO_ANNOTATION_BATCH["MAX_TEXTS"]
+    if len(texts) > max_texts:
+        raise ValidationError(f"Cannot annotate more than {max_texts} texts at once")
+    return texts
+
 
-        return Response(data, status=status_code)
+def validate_and_save(serializer):
+    serializer.is_valid(raise_exception=True)
+    serializer.save()
 
 
 # Create your views here.
@@ -115,19 +196,33 @@ class CustomTokenView(jwt_views.TokenObtainPairView):
 class RetrieveAnnotationView(ListCreateAPIView):
     http_method_names = ["get", "post"]
     serializer_class = RetrieveAnnotationSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, AnnotationSearchFilter]
     filterset_fields = ["created_at", "user_email", "annotation_label"]
     search_fields = ["user_email", "annotation_label", "text", "position"]
     ordering_fields = ["created_at"]
+    pagination_class = CursorOrOffsetPagination
+
+    # plain limit/offset listings are served from the cached thread document
+    document_query_params = {"limit", "offset"}
 
     def get_queryset(self, email_id):
         try:
-            return Annotation.objects.filter(
-                email_id__iexact=email_id, is_deleted=False
-            )
+            return Annotation.objects.for_thread(email_id).filter(is_deleted=False)
         except Annotation.DoesNotExist as e:
             raise ValidationError("Email ID does not exist") from e
 
+    def get_page_data(self, request, email_id):
+        if set(request.query_params) <= self.document_query_params:
+            version, _ = current_version(request, ResourceVersion.thread_key(email_id))
+            rows = annotation_rows(get_thread_documents().get(email_id, version))
+            return self.paginate_queryset(rows)
+        queryset = self.filter_queryset(self.get_queryset(email_id))
+        queryset = AnnotationValuesSerializer.get_queryset(queryset)
+        if page := self.paginate_queryset(queryset):
+            return AnnotationValuesSerializer(page).data
+        return page
+
+    @versioned(lambda email_id, **kwargs: ResourceVersion.thread_key(email_id))
     def get(self, request, **kwargs):
         """
         Retrieves an annotation for a specific email.
@@ -138,10 +233,8 @@ class RetrieveAnnotationView(ListCreateAPIView):
         email_id = kwargs.get("email_id")
 
         try:
-            queryset = self.filter_queryset(self.get_queryset(email_id))
-            if page := self.paginate_queryset(queryset):
-                serializer = self.serializer_class(page, many=True)
-                query_response = self.get_paginated_response(serializer.data)
+            if page := self.get_page_data(request, email_id):
+                query_response = self.get_paginated_response(page)
                 message = query_response.data
                 code = status.HTTP_200_OK
                 _status = "success"
@@ -151,7 +244,9 @@ class RetrieveAnnotationView(ListCreateAPIView):
                 _status = "failed"
         except Exception as ex:
             logger.error(
-                f"Exception in GET RetrieveAnnotation for thread - {email_id}: {ex}",
+                "Exception in GET RetrieveAnnotation for thread - %s: %s",
+                email_id,
+                ex,
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -173,7 +268,6 @@ class RetrieveAnnotationView(ListCreateAPIView):
 
         try:
             email_participants = confirm_email_and_participants(email_id)
-            print(email_participants)
             if email not in email_participants:
                 raise ValidationError(
                     "Annotator email address not a part of this email thread"
@@ -196,6 +290,135 @@ class RetrieveAnnotationView(ListCreateAPIView):
         return response.send()
 
 
+class ThreadOverviewView(APIView):
+    """
+    Live annotations of a thread, each with its comment count and newest
+    comments, so a client renders a thread without one request per annotation
+    """
+
+    http_method_names = ["get"]
+    serializer_class = ThreadOverviewSerializer
+
+    def get_comment_limit(self, request):
+        limits = settings.THREAD_OVERVIEW
+        try:
+            limit = int(request.query_params.get("comments", limits["COMMENTS"]))
+        except ValueError as e:
+            raise ValidationError("comments must be a number") from e
+        return min(max(limit, 0), limits["MAX_COMMENTS"])
+
+    def get_queryset(self, email_id, latest):
+        return (
+            Annotation.objects.for_thread(email_id)
+            .filter(is_deleted=False)
+            .with_comment_summary(latest=latest)
+        )
+
+    @versioned(lambda email_id, **kwargs: ResourceVersion.thread_key(email_id))
+    def get(self, request, **kwargs):
+        """
+        Args:
+            comments (int): newest comments to include per annotation
+        """
+        email_id = kwargs.get("email_id")
+
+        try:
+            latest = self.get_comment_limit(request)
+            documents = get_thread_documents()
+            if latest == documents.comments:
+                version, _ = current_version(
+                    request, ResourceVersion.thread_key(email_id)
+                )
+                annotations = documents.get(email_id, version)
+            else:
+                queryset = self.get_queryset(email_id, latest)
+                annotations = self.serializer_class(queryset, many=True).data
+            if annotations:
+                message = annotations
+                code = status.HTTP_200_OK
+                _status = "success"
+            else:
+                message = "No annotation found for this email"
+                code = status.HTTP_400_BAD_REQUEST
+                _status = "failed"
+        except Exception as ex:
+            logger.error("Exception in GET ThreadOverview for thread %s: %s", email_id, ex)
+            message = ex.args[0]
+            code = status.HTTP_400_BAD_REQUEST
+            _status = "failed"
+
+        response = CustomAPIResponse(message, code, _status)
+        return response.send()
+
+
+class ThreadAnnotationBatchView(APIView):
+    """
+    Live annotations of several threads, grouped by email id, so an inbox
+    screen needs one request instead of one per visible thread
+    """
+
+    http_method_names = ["get"]
+
+    def get_email_ids(self, request):
+        values = [
+            value.strip()
+            for param in request.query_params.getlist("email_ids")
+            for value in param.split(",")
+        ]
+        email_ids = list(dict.fromkeys(value for value in values if value))
+        if not email_ids:
+            raise ValidationError("email_ids is required")
+        max_threads = settings.THREAD_BATCH["MAX_THREADS"]
+        if len(email_ids) > max_threads:
+            raise ValidationError(f"Cannot fetch more than {max_threads} threads at once")
+        return email_ids
+
+    def get_limit(self, request):
+        limits = settings.THREAD_BATCH
+        try:
+            limit = int(request.query_params.get("limit", limits["LIMIT"]))
+        except ValueError as e:
+            raise ValidationError("limit must be a number") from e
+        return min(max(limit, 1), limits["MAX_LIMIT"])
+
+    def get_queryset(self, email_ids, limit):
+        return (
+            Annotation.objects.for_threads(email_ids)
+            .filter(is_deleted=False)
+            .latest_per_thread(limit)
+        )
+
+    def get(self, request, **kwargs):
+        """
+        Args:
+            email_ids (str): comma separated email ids, or the parameter repeated
+            limit (int): newest annotations to include per thread
+        """
+        try:
+            email_ids = self.get_email_ids(request)
+            queryset = self.get_queryset(email_ids, self.get_limit(request))
+            rows = AnnotationValuesSerializer(
+                AnnotationValuesSerializer.get_queryset(queryset)
+            ).data
+
+            threads = {normalize_email_id(email_id): [] for email_id in email_ids}
+            for row in rows:
+                threads[normalize_email_id(row["email_id"])].append(row)
+            message = {
+                email_id: threads[normalize_email_id(email_id)] for email_id in email_ids
+            }
+            code = status.HTTP_200_OK
+            _status = "success"
+        except Exception as ex:
+            logger.error("Exception in GET ThreadAnnotationBatch: %s", ex)
+            message = ex.args[0]
+            code = status.HTTP_400_BAD_REQUEST
+            _status = "failed"
+
+        response = CustomAPIResponse(message, code, _status)
+        return response.send()
+
+
 class RetrieveAnnotationDetailView(RetrieveUpdateDestroyAPIView):
     """
     Retrieve, update and delete annotation instance
@@ -207,8 +430,8 @@ class RetrieveAnnotationDetailView(RetrieveUpdateDestroyAPIView):
 
     def get_object(self, id, email_id):
         try:
-            return Annotation.objects.get(
-                id__iexact=id, email_id__iexact=email_id, is_deleted=False
+            return Annotation.objects.for_thread(email_id).get(
+                id__iexact=id, is_deleted=False
             )
         except:
             raise ValidationError("No annotation found matching the given parameters")
@@ -225,7 +448,10 @@ class RetrieveAnnotationDetailView(RetrieveUpdateDestroyAPIView):
             _status = "success"
         except Exception as ex:
             logger.error(
-                f"Exception in GET RetrieveAnnotationDetailView with thread id {email_id} and annotation id {annotation_id}: {ex.args[0]}"
+                "Exception in GET RetrieveAnnotationDetailView with thread id %s and annotation id %s: %s",
+                email_id,
+                annotation_id,
+                ex.args[0],
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -256,7 +482,9 @@ class RetrieveAnnotationDetailView(RetrieveUpdateDestroyAPIView):
             _status = "success"
         except Exception as ex:
             logger.error(
-                f"Exception in PATCH RetrieveAnnotationDetailView with id {annotation_id}: {ex}"
+                "Exception in PATCH RetrieveAnnotationDetailView with id %s: %s",
+                annotation_id,
+                ex,
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -280,7 +508,10 @@ class RetrieveAnnotationDetailView(RetrieveUpdateDestroyAPIView):
             _status = "success"
         except Exception as ex:
             logger.error(
-                f"Exception in GET RetrieveAnnotationDetailView with thread id {email_id} and annotation id {annotation_id}: {ex}"
+                "Exception in GET RetrieveAnnotationDetailView with thread id %s and annotation id %s: %s",
+                email_id,
+                annotation_id,
+                ex,
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -290,9 +521,149 @@ class RetrieveAnnotationDetailView(RetrieveUpdateDestroyAPIView):
         return response.send()
 
 
+class BulkAnnotationView(CreateAPIView):
+    """
+    Create several annotations on one thread with a single participant check
+    and a single insert
+    """
+
+    http_method_names = ["post"]
+    serializer_class = RetrieveAnnotationSerializer
+
+    def get_items(self, data):
+        items = data.get("annotations") if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            raise ValidationError("Provide a non-empty list of annotations")
+        if len(items) > settings.BULK_ANNOTATION_MAX:
+            raise ValidationError(
+                f"Cannot create more than {settings.BULK_ANNOTATION_MAX} annotations at once"
+            )
+        return items
+
+    def find_conflicts(self, email_id, candidates):
+        """
+        Returns the (annotation_label, user_email) pairs of `candidates` that
+        already exist on the thread, which `unique_thread_annotation` rejects
+        """
+        existing = Annotation.objects.filter(
+            email_id=email_id,
+            annotation_label__in={obj.annotation_label for obj in candidates},
+            user_email__in={obj.user_email for obj in candidates},
+        ).values_list("annotation_label", "user_email")
+        return set(existing)
+
+    def insert(self, email_id, candidates, results):
+        conflicts = self.find_conflicts(email_id, candidates.values())
+        to_create = []
+        for index, obj in candidates.items():
+            if (obj.annotation_label, obj.user_email) in conflicts:
+                results[index] = {
+                    "status": "failed",
+                    "message": "You already created notes similar to this on current annotation",
+                }
+            else:
+                to_create.append(obj)
+
+        with transaction.atomic():
+            Annotation.objects.bulk_create(to_create)
+            # bulk_create sends no post_save signal
+            record_changes(
+                [obj.email_key for obj in to_create], [obj.pk for obj in to_create]
+            )
+            for obj in to_create:
+                publish_on_commit(
+                    obj.email_key,
+                    "annotation.created",
+                    self.serializer_class(obj).data,
+                )
+        for index, obj in candidates.items():
+            if index not in results:
+                results[index] = {"status": "success", "id": obj.id}
+
+    def post(self, request, **kwargs):
+        """create annotations in bulk
+
+        Args:
+            annotations (list): annotations, each with text, user_email,
+                annotation_label and an optional position
+        """
+        email_id = kwargs.get("email_id")
+
+        try:
+            items = self.get_items(request.data)
+            email_participants = confirm_email_and_participants(email_id)
+
+            results = {}
+            candidates = {}
+            seen = set()
+            for index, item in enumerate(items):
+                serializer = self.serializer_class(
+                    data={**item, "email_id": email_id}
+                    if isinstance(item, dict)
+                    else None
+                )
+                if not serializer.is_valid():
+                    results[index] = {"status": "failed", "message": serializer.errors}
+                    continue
+                data = serializer.validated_data
+                if data.get("user_email") not in email_participants:
+                    results[index] = {
+                        "status": "failed",
+                        "message": "Annotator email address not a part of this email thread",
+                    }
+                    continue
+                key = (data["annotation_label"], data["user_email"])
+                if key in seen:
+                    results[index] = {
+                        "status": "failed",
+                        "message": "Duplicate annotation label for this annotator in request",
+                    }
+                    continue
+                seen.add(key)
+                candidates[index] = Annotation(**data)
+
+            if candidates:
+                try:
+                    self.insert(email_id, candidates, results)
+                except IntegrityError:
+                    # a concurrent writer took one of the pairs; re-check once
+                    logger.warning(
+                        "Retrying bulk annotation insert for thread %s", email_id
+                    )
+                    for obj in candidates.values():
+                        obj.id = None
+                    self.insert(email_id, candidates, results)
+
+            results = [{"index": index, **results[index]} for index in range(len(items))]
+            created = sum(result["status"] == "success" for result in results)
+            if created:
+                message = {
+                    "created": created,
+                    "failed": len(results) - created,
+                    "results": results,
+                }
+                code = status.HTTP_201_CREATED
+                _status = "success"
+            else:
+                message = results
+                code = status.HTTP_400_BAD_REQUEST
+                _status = "failed"
+        except Exception as e:
+            logger.error(
+                "Exception in POST BulkAnnotationView for thread %s: %s", email_id, e
+            )
+            message = e.args[0]
+            code = status.HTTP_400_BAD_REQUEST
+            _status = "failed"
+
+        response = CustomAPIResponse(message, code, _status)
+        return response.send()
+
+
 class AnnotationCommentView(ListAPIView):
     http_method_names = ["get", "post"]
     serializer_class = AnnotationCommentSerializer
+    pagination_class = CursorOrOffsetPagination
 
     def get_object(self, annotation_id):
         try:
@@ -306,6 +677,9 @@ class AnnotationCommentView(ListAPIView):
         except Exception as ex:
             raise ValidationError("No comments for given annotation") from ex
 
+    @versioned(
+        lambda annotation_id, **kwargs: ResourceVersion.annotation_key(annotation_id)
+    )
     def get(self, request, **kwargs):
         """
         Get comments for a given annotation
@@ -313,9 +687,11 @@ class AnnotationCommentView(ListAPIView):
         annotation_id = kwargs.get("annotation_id")
 
         try:
-            queryset = self.get_queryset(annotation_id)
+            queryset = AnnotationCommentValuesSerializer.get_queryset(
+                self.get_queryset(annotation_id)
+            )
             if page := self.paginate_queryset(queryset):
-                serializer = self.serializer_class(page, many=True)
+                serializer = AnnotationCommentValuesSerializer(page)
                 query_response = self.get_paginated_response(serializer.data)
                 message = query_response.data
                 code = status.HTTP_200_OK
@@ -326,7 +702,9 @@ class AnnotationCommentView(ListAPIView):
                 _status = "failed"
         except Exception as ex:
             logger.error(
-                f"Exception in GET annotationcomment with id {annotation_id}: {ex}"
+                "Exception in GET annotationcomment with id %s: %s",
+                annotation_id,
+                ex,
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -361,7 +739,9 @@ class AnnotationCommentView(ListAPIView):
             _status = "success"
         except Exception as ex:
             logger.error(
-                f"Exception in POST annotationcomment with id {kwargs.get('annotation_id')}: {ex}"
+                "Exception in POST annotationcomment with id %s: %s",
+                kwargs.get("annotation_id"),
+                ex,
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -408,7 +788,10 @@ class AnnotationCommentDetailView(RetrieveUpdateDestroyAPIView):
             _status = "success"
         except Exception as ex:
             logger.error(
-                f"Exception in GET AnnotationCommentDetailView with annotation id {annotation_id}, comment id {comment_id}: {ex}"
+                "Exception in GET AnnotationCommentDetailView with annotation id %s, comment id %s: %s",
+                annotation_id,
+                comment_id,
+                ex,
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -461,7 +844,10 @@ class AnnotationCommentDetailView(RetrieveUpdateDestroyAPIView):
             _status = "success"
         except Exception as ex:
             logger.error(
-                f"Exception in PATCH AnnotationCommentDetailView with annotation id {annotation_id}, comment id {comment_id}: {ex}"
+                "Exception in PATCH AnnotationCommentDetailView with annotation id %s, comment id %s: %s",
+                annotation_id,
+                comment_id,
+                ex,
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -488,7 +874,10 @@ class AnnotationCommentDetailView(RetrieveUpdateDestroyAPIView):
             _status = "success"
         except Exception as ex:
             logger.error(
-                f"Exception in GET AnnotationCommentDetailView with annotation id {annotation_id}, comment id {comment_id}: {ex}"
+                "Exception in GET AnnotationCommentDetailView with annotation id %s, comment id %s: %s",
+                annotation_id,
+                comment_id,
+                ex,
             )
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
@@ -504,26 +893,283 @@ class AutoCreateAnnotationView(CreateAPIView):
     """
 
     http_method_names = ["post"]
+    throttle_scope = "auto_annotate"
 
     def check_data(self, data):
-        if "text" not in data:
-            raise ValidationError("Text is required")
+        return get_batch_texts(data)
 
     def post(self, request, *args, **kwargs):
         """
-        Create new annotation using AI
+        Create new annotation using AI. Send "texts" (a list) instead of
+        "text" to annotate a batch; results are returned per text, in order
         """
         try:
-            self.check_data(request.data)
-            data = auto_create_annotation(request.data.get("text"))
+            if (texts := self.check_data(request.data)) is not None:
+                data = auto_create_annotations(texts)
+            else:
+                data = auto_create_annotation(request.data.get("text"))
             message = data
             code = status.HTTP_201_CREATED
             _status = "success"
         except Exception as ex:
-            logger.error(f"Exception in POST AutoCreateAnnotationView: {ex}")
+            logger.error("Exception in POST AutoCreateAnnotationView: %s", ex)
             message = ex.args[0]
             code = status.HTTP_400_BAD_REQUEST
             _status = "failed"
 
         response = CustomAPIResponse(message, code, _status)
         return response.send()
+
+
+class AsyncAPIAccessMixin:
+    """
+    Runs the DRF authentication, permission and throttle checks of the
+    regular API views before an async plain Django view, which would
+    otherwise skip them. Refused requests get the usual failed envelope.
+    """
+
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = None
+
+    def check_access(self, request, *args, **kwargs):
+        api_view = APIView(
+            authentication_classes=self.authentication_classes,
+            permission_classes=self.permission_classes,
+            throttle_classes=self.throttle_classes,
+            throttle_scope=self.throttle_scope,
+            args=args,
+            kwargs=kwargs,
+        )
+        api_request = api_view.initialize_request(request, *args, **kwargs)
+        api_view.request = api_request
+        api_view.headers = {}
+        try:
+            api_view.initial(api_request, *args, **kwargs)
+        except APIException as ex:
+            response = CustomAPIResponse(ex.detail, ex.status_code, "failed").send_json()
+            if isinstance(ex, Throttled) and ex.wait is not None:
+                response["Retry-After"] = str(math.ceil(ex.wait))
+            return response
+        request.user = api_request.user
+        return None
+
+    async def dispatch(self, request, *args, **kwargs):
+        denied = await sync_to_async(self.check_access)(request, *args, **kwargs)
+        if denied is not None:
+            return denied
+        return await super().dispatch(request, *args, **kwargs)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncRetrieveAnnotationView(AsyncAPIAccessMixin, View):
+    """
+    Async variant of `RetrieveAnnotationView.post` for ASGI deployments.
+    The Nylas participant check is awaited, so a worker is not held while
+    Nylas responds.
+    """
+
+    http_method_names = ["post"]
+    serializer_class = RetrieveAnnotationSerializer
+
+    async def post(self, request, **kwargs):
+        email_id = kwargs.get("email_id")
+
+        try:
+            data = parse_json_body(request)
+            email_participants = await aconfirm_email_and_participants(email_id)
+            if data.get("user_email") not in email_participants:
+                raise ValidationError(
+                    "Annotator email address not a part of this email thread"
+                )
+
+            serializer = self.serializer_class(data={**data, "email_id": email_id})
+            await sync_to_async(validate_and_save)(serializer)
+            message = "Annotation successfully created"
+            code = status.HTTP_201_CREATED
+            _status = "success"
+        except Exception as e:
+            message = e.args[0]
+            code = status.HTTP_400_BAD_REQUEST
+            _status = "failed"
+
+        response = CustomAPIResponse(message, code, _status)
+        return response.send_json()
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAnnotationCommentView(AsyncAPIAccessMixin, View):
+    """
+    Async variant of `AnnotationCommentView.post`
+    """
+
+    http_method_names = ["post"]
+    serializer_class = AnnotationCommentSerializer
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = parse_json_body(request)
+            try:
+                obj = await Annotation.objects.aget(
+                    id__iexact=kwargs.get("annotation_id")
+                )
+            except Annotation.DoesNotExist as ex:
+                raise ValidationError("Invalid annotation id") from ex
+
+            email_participants = await aconfirm_email_and_participants(obj.email_id)
+            if data.get("author_email") not in email_participants:
+                raise ValidationError(
+                    "Annotator email address not a part of this email thread"
+                )
+
+            serializer = self.serializer_class(data={**data, "annotation": obj.id})
+            await sync_to_async(validate_and_save)(serializer)
+            message = "Comment posted successfully"
+            code = status.HTTP_201_CREATED
+            _status = "success"
+        except Exception as ex:
+            logger.error(
+                "Exception in async POST annotationcomment with id %s: %s",
+                kwargs.get("annotation_id"),
+                ex,
+            )
+            message = ex.args[0]
+            code = status.HTTP_400_BAD_REQUEST
+            _status = "failed"
+
+        response = CustomAPIResponse(message, code, _status)
+        return response.send_json()
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncAutoCreateAnnotationView(AsyncAPIAccessMixin, View):
+    """
+    Async variant of `AutoCreateAnnotationView.post`
+    """
+
+    http_method_names = ["post"]
+    throttle_scope = "auto_annotate"
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = parse_json_body(request)
+            if (texts := get_batch_texts(data)) is not None:
+                message = await aauto_create_annotations(texts)
+            else:
+                message = await aauto_create_annotation(data.get("text"))
+            code = status.HTTP_201_CREATED
+            _status = "success"
+        except Exception as ex:
+            logger.error("Exception in async POST AutoCreateAnnotationView: %s", ex)
+            message = ex.args[0]
+            code = status.HTTP_400_BAD_REQUEST
+            _status = "failed"
+
+        response = CustomAPIResponse(message, code, _status)
+        return response.send_json()
+
+
+class AsyncThreadEventsView(AsyncAPIAccessMixin, View):
+    """
+    Server-sent events stream of annotation and comment changes on a thread,
+    for authenticated users (send the Bearer token, e.g. with a fetch based
+    EventSource). Needs an ASGI server: under WSGI each stream would hold a
+    worker, so it answers 501 there. Reconnecting clients send
+    `Last-Event-ID` (or `?last_event_id=`) to receive the events they missed.
+    """
+
+    http_method_names = ["get"]
+
+    async def get(self, request, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            response = CustomAPIResponse(
+                "Event streams are only served over ASGI",
+                status.HTTP_501_NOT_IMPLEMENTED,
+                "failed",
+            )
+            return response.send_json()
+
+        last_event_id = request.headers.get("Last-Event-ID") or request.GET.get(
+            "last_event_id"
+        )
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            response = CustomAPIResponse(
+                "Invalid Last-Event-ID", status.HTTP_400_BAD_REQUEST, "failed"
+            )
+            return response.send_json()
+
+        response = StreamingHttpResponse(
+            stream_events(kwargs.get("email_id"), last_event_id),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # keep nginx from buffering the stream
+        return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class NylasWebhookView(View):
+    """
+    Receives Nylas message notifications and refreshes the participant cache
+    in the background, so annotation writes rarely wait on Nylas
+    """
+
+    http_method_names = ["get", "post"]
+
+    def get(self, request, *args, **kwargs):
+        # Nylas verifies a new webhook by expecting its challenge echoed back
+        return HttpResponse(request.GET.get("challenge", ""), content_type="text/plain")
+
+    def post(self, request, *args, **kwargs):
+        try:
+            if not verify_signature(
+                request.body,
+                request.headers.get("X-Nylas-Signature"),
+                settings.NYLAS_WEBHOOK["SECRET"],
+            ):
+                logger.warning("Rejected Nylas webhook with an invalid signature")
+                response = CustomAPIResponse(
+                    "Invalid signature", status.HTTP_401_UNAUTHORIZED, "failed"
+                )
+                return response.send_json()
+
+            deltas = parse_json_body(request).get("deltas")
+            if not isinstance(deltas, list):
+                raise ValidationError("Notification must contain a list of deltas")
+            submit(deltas)
+            message = {"accepted": len(deltas)}
+            code = status.HTTP_200_OK
+            _status = "success"
+        except Exception as ex:
+            logger.error("Exception in POST NylasWebhookView: %s", ex)
+            message = ex.args[0]
+            code = status.HTTP_400_BAD_REQUEST
+            _status = "failed"
+
+        response = CustomAPIResponse(message, code, _status)
+        return response.send_json()
+
+
+class MetricsView(View):
+    """
+    Request latency and SQL metrics of this worker in the Prometheus text
+    format. Scrapers authenticate with `Authorization: Bearer <METRICS_TOKEN>`
+    when a token is configured
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        config = settings.METRICS
+        if not config["ENABLED"]:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        if config["TOKEN"] and not compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {config['TOKEN']}"
+        ):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        return HttpResponse(
+            render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -0,0 +1,132 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import caches
+
+from main.helper import confirm_email_participant, refresh_participants
+
+logger = logging.getLogger("server_log")
+
+# notifications that can add a message or change its participants
+MESSAGE_TRIGGERS = {"message.created", "message.updated"}
+
+_executor = None
+_executor_lock = threading.Lock()
+# futures not finished yet; submit() and the done-callbacks change the set from
+# other threads while flush() reads it, so both go through the lock
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def verify_signature(body, signature, secret):
+    """
+    Checks the `X-Nylas-Signature` header, a hex HMAC-SHA256 of the raw
+    request body keyed with the Nylas client secret.
+    """
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def sign(body, secret):
+    """Signature Nylas would send for `body`, used to replay recorded payloads."""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def delivery_key(delta):
+    """
+    Identifies a notification across redeliveries: Nylas resends the same
+    type, object id and date when a delivery is retried.
+    """
+    object_data = delta.get("object_data") or {}
+    identity = [delta.get("type"), object_data.get("id"), delta.get("date")]
+    return "nylas-webhook:" + hashlib.sha256(json.dumps(identity).encode()).hexdigest()
+
+
+def payload_participants(object_data):
+    """
+    Participants included in the notification itself, if Nylas sent the
+    full message (`attributes` with from/to), so no API call is needed.
+    """
+    attributes = object_data.get("attributes") or {}
+    if attributes.get("from") and attributes.get("to"):
+        return confirm_email_participant(attributes)
+    return None
+
+
+def process_delta(delta):
+    """
+    Updates the participant cache for one notification, once per delivery.
+
+    Returns:
+        bool: False if the notification was a duplicate or not about messages.
+    """
+    if delta.get("type") not in MESSAGE_TRIGGERS:
+        return False
+
+    config = settings.NYLAS_WEBHOOK
+    cache = caches[config["CACHE_ALIAS"]]
+    key = delivery_key(delta)
+    # add() is atomic, so concurrent duplicate deliveries run only once
+    if not cache.add(key, True, config["DEDUPE_TTL"]):
+        logger.info("Skipping duplicate Nylas notification %s", key)
+        return False
+
+    object_data = delta.get("object_data") or {}
+    try:
+        refresh_participants(
+            object_data["id"],
+            participants=payload_participants(object_data),
+            timeout=config["PARTICIPANT_TTL"],
+        )
+    except Exception as ex:
+        # let a redelivery or replay try again
+        cache.delete(key)
+        logger.error("Failed to process Nylas notification %s: %s", key, ex)
+        return False
+    return True
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.NYLAS_WEBHOOK["WORKERS"],
+                thread_name_prefix="nylas-webhook",
+            )
+        return _executor
+
+
+def _forget(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def submit(deltas):
+    """Processes notification deltas in the background."""
+    for delta in deltas:
+        future = _get_executor().submit(process_delta, delta)
+        with _pending_lock:
+            _pending.add(future)
+        # outside the lock: the callback runs right away if already done
+        future.add_done_callback(_forget)
+
+
+def flush(timeout=None):
+    """
+    Waits for queued notifications to be processed.
+
+    Returns:
+        bool: True if every notification submitted so far has finished.
+    """
+    with _pending_lock:
+        pending = set(_pending)
+    _, not_done = wait(pending, timeout=timeout)
+    return not not_done
@@ -28,12 +28,16 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "main",
     "rest_framework",
+    "rest_framework_simplejwt.token_blacklist",
     "django_filters",
 ]
 
 MIDDLEWARE = [
+    "main.middleware.MetricsMiddleware",
+    "main.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -80,6 +84,41 @@ DATABASES = {
     }
 }
 
+# Read replicas of "default" as comma separated host[:port] (DB_REPLICA_HOSTS), used
+# for GET/HEAD requests by main.routers.ReplicaRouter. After a write, a client reads
+# from the primary for STICKY_SECONDS, carried by the COOKIE cookie or echoed header
+for index, replica in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(","))):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["main.routers.ReplicaRouter"]
+READ_REPLICA = {
+    "STICKY_SECONDS": float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5")),
+    "COOKIE": "read_primary_until",
+    "HEADER": "X-Read-Primary-Until",
+}
+
+# Cache shared by all workers, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# with CACHE_LOCATION=redis://127.0.0.1:6379/1 (needs the redis package). Without one,
+# each process has its own local memory cache and the caches that depend on writes
+# in one worker reaching the others are off by default (SHARED_CACHE)
+LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND") or LOCAL_CACHE_BACKENDS[0],
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+SHARED_CACHE = CACHES["default"]["BACKEND"] not in LOCAL_CACHE_BACKENDS
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -112,6 +151,20 @@ SIMPLE_JWT = {
     "UPDATE_LAST_LOGIN": True,
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
+    "TOKEN_REFRESH_SERIALIZER": "main.serializer.CustomTokenRefreshSerializer",
+}
+
+# Per-process Bloom filter in front of the refresh token blacklist, see main.tokens.
+# Tokens blacklisted by another worker are caught after at most SYNC_INTERVAL
+# seconds; prune_tokens deletes expired rows PRUNE_BATCH_SIZE at a time
+TOKEN_BLACKLIST = {
+    "CAPACITY": int(os.getenv("TOKEN_BLACKLIST_CAPACITY", "100000")),
+    "ERROR_RATE": float(os.getenv("TOKEN_BLACKLIST_ERROR_RATE", "0.01")),
+    "SYNC_INTERVAL": float(os.getenv("TOKEN_BLACKLIST_SYNC_INTERVAL", "2")),
+    "SYNC_OVERLAP": float(os.getenv("TOKEN_BLACKLIST_SYNC_OVERLAP", "30")),
+    "REBUILD_INTERVAL": float(os.getenv("TOKEN_BLACKLIST_REBUILD_INTERVAL", "3600")),
+    "PRUNE_BATCH_SIZE": int(os.getenv("TOKEN_PRUNE_BATCH_SIZE", "1000")),
+    "PRUNE_SLEEP": float(os.getenv("TOKEN_PRUNE_SLEEP", "0.2")),
 }
 
 # Rest Framework settings
@@ -119,17 +172,184 @@ REST_FRAMEWORK = {
     "NON_FIELD_ERRORS_KEY": "error",
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 15,
+    "DEFAULT_RENDERER_CLASSES": (
+        "main.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
     "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.AllowAny",),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "main.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "rest_framework.schemas.coreapi.AutoSchema",
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "main.throttling.AnonRateThrottle",
+        "main.throttling.UserRateThrottle",
+        "main.throttling.ScopedRateThrottle",
     ],
-    "DEFAULT_THROTTLE_RATES": {"anon": "150/day", "user": "800/day"},
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "150/day",
+        "user": "800/day",
+        # views with a throttle_scope, on top of the anon/user limits
+        "auto_annotate": os.getenv("AUTO_ANNOTATE_RATE", "60/hour"),
+    },
+}
+
+# Where throttle buckets live: main.throttling.CacheBucketStore (CACHES[CACHE_ALIAS],
+# the default with a SHARED_CACHE) and main.throttling.DatabaseBucketStore (one
+# upsert on the primary per request, opt-in) are shared by all workers and nodes,
+# main.throttling.LocalBucketStore is per process (the default otherwise)
+THROTTLE = {
+    "STORE": os.getenv("THROTTLE_STORE")
+    or (
+        "main.throttling.CacheBucketStore"
+        if SHARED_CACHE
+        else "main.throttling.LocalBucketStore"
+    ),
+    "CACHE_ALIAS": os.getenv("THROTTLE_CACHE_ALIAS", "default"),
+}
+
+# Per-endpoint latency, per-dependency time and SQL count histograms served at
+# /metrics/. Off by default; TOKEN, when set, is required as a Bearer token to scrape
+METRICS = {
+    "ENABLED": os.getenv("METRICS_ENABLED", "False") == "True",
+    "TOKEN": os.getenv("METRICS_TOKEN", ""),
+}
+
+# Users resolved from access tokens, cached until the token expires (at most TIMEOUT
+# seconds) and dropped when the account is saved or deleted. With several workers,
+# use the "django" backend over a shared cache so the drop reaches every worker;
+# without a SHARED_CACHE, TIMEOUT defaults to a few seconds, the longest another
+# worker may keep accepting a deactivated account
+AUTH_USER_CACHE = {
+    "BACKEND": os.getenv("AUTH_USER_CACHE_BACKEND", "django"),
+    "CACHE_ALIAS": os.getenv("AUTH_USER_CACHE_ALIAS", "default"),
+    "TIMEOUT": int(os.getenv("AUTH_USER_CACHE_TTL") or (300 if SHARED_CACHE else 5)),
+    "MAX_ENTRIES": int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "10000")),
+}
+
+# Maximum number of annotations accepted by the bulk create endpoint
+BULK_ANNOTATION_MAX = int(os.getenv("BULK_ANNOTATION_MAX", "100"))
+
+# Threads accepted per request by the multi-thread annotation endpoint, and the
+# newest annotations returned per thread (clients may ask for up to MAX_LIMIT)
+THREAD_BATCH = {
+    "MAX_THREADS": int(os.getenv("THREAD_BATCH_MAX_THREADS", "50")),
+    "LIMIT": int(os.getenv("THREAD_BATCH_LIMIT", "15")),
+    "MAX_LIMIT": int(os.getenv("THREAD_BATCH_MAX_LIMIT", "100")),
+}
+
+# Newest comments returned per annotation by the thread overview endpoint,
+# clients may ask for up to MAX_COMMENTS with ?comments=
+THREAD_OVERVIEW = {
+    "COMMENTS": int(os.getenv("THREAD_OVERVIEW_COMMENTS", "3")),
+    "MAX_COMMENTS": int(os.getenv("THREAD_OVERVIEW_MAX_COMMENTS", "20")),
+}
+
+# Pre-serialized annotations per thread, invalidated when a write commits.
+# CACHE_ALIAS must be shared by all workers (Redis, Memcached) for writes in one
+# worker to reach the others; TIMEOUT bounds the age of any document and
+# STALE_SECONDS lets readers keep the previous document for that long after a write.
+# Enabled by default only with a SHARED_CACHE
+THREAD_DOCUMENT = {
+    "ENABLED": (os.getenv("THREAD_DOCUMENT_ENABLED") or str(SHARED_CACHE)) == "True",
+    "CACHE_ALIAS": os.getenv("THREAD_DOCUMENT_CACHE_ALIAS", "default"),
+    "TIMEOUT": int(os.getenv("THREAD_DOCUMENT_TTL", "60")),
+    "STALE_SECONDS": float(os.getenv("THREAD_DOCUMENT_STALE_SECONDS", "0")),
+}
+
+# Server-sent events stream of thread changes (api/async/threads/<email_id>/events/).
+# The default broker is per process: run one ASGI worker or plug in a shared one.
+# HISTORY events per thread are kept for Last-Event-ID resumes, for HISTORY_TTL
+# seconds after the thread's last event and for at most MAX_THREADS threads.
+# Subscribers more than QUEUE_SIZE events behind are disconnected, and streams
+# end after MAX_DURATION seconds (clients reconnect). HEARTBEAT is in seconds
+EVENT_STREAM = {
+    "ENABLED": os.getenv("EVENT_STREAM_ENABLED", "True") == "True",
+    "BROKER": os.getenv("EVENT_STREAM_BROKER", "main.events.InMemoryBroker"),
+    "HISTORY": int(os.getenv("EVENT_STREAM_HISTORY", "500")),
+    "QUEUE_SIZE": int(os.getenv("EVENT_STREAM_QUEUE_SIZE", "100")),
+    "HEARTBEAT": float(os.getenv("EVENT_STREAM_HEARTBEAT", "15")),
+    "RETRY_MS": int(os.getenv("EVENT_STREAM_RETRY_MS", "3000")),
+    "HISTORY_TTL": float(os.getenv("EVENT_STREAM_HISTORY_TTL", "3600")),
+    "MAX_THREADS": int(os.getenv("EVENT_STREAM_MAX_THREADS", "10000")),
+    "MAX_DURATION": float(os.getenv("EVENT_STREAM_MAX_DURATION", "300")),
+}
+
+# archive_deleted command: soft-deleted rows older than RETENTION_DAYS move to the
+# archive tables BATCH_SIZE at a time, pausing SLEEP seconds between batches
+ARCHIVE = {
+    "RETENTION_DAYS": float(os.getenv("ARCHIVE_RETENTION_DAYS", "30")),
+    "BATCH_SIZE": int(os.getenv("ARCHIVE_BATCH_SIZE", "500")),
+    "SLEEP": float(os.getenv("ARCHIVE_SLEEP", "0.5")),
+}
+
+# Annotation ids reserved from the database per round trip, see main.keygen
+ANNOTATION_KEY_BLOCK_SIZE = int(os.getenv("ANNOTATION_KEY_BLOCK_SIZE", "50"))
+
+# Batch mode of the AI auto-annotation endpoint: maximum texts per request,
+# concurrent LLM calls, seconds allowed for the whole batch and LLM calls
+# running at once across all batches of the process, timed out ones included
+AUTO_ANNOTATION_BATCH = {
+    "MAX_TEXTS": int(os.getenv("AUTO_ANNOTATION_MAX_TEXTS", "50")),
+    "CONCURRENCY": int(os.getenv("AUTO_ANNOTATION_CONCURRENCY", "8")),
+    "DEADLINE": float(os.getenv("AUTO_ANNOTATION_DEADLINE", "30")),
+    "MAX_IN_FLIGHT": int(os.getenv("AUTO_ANNOTATION_MAX_IN_FLIGHT", "32")),
+}
+
+# Local rule-based labelling tried before the LLM. The LLM is skipped when every
+# matched label scores at least THRESHOLD; matches above MIN_CONFIDENCE are the
+# fallback when OpenAI is unreachable
+ANNOTATION_CLASSIFIER = {
+    "ENABLED": os.getenv("ANNOTATION_CLASSIFIER_ENABLED", "True") == "True",
+    "THRESHOLD": float(os.getenv("ANNOTATION_CLASSIFIER_THRESHOLD", "0.8")),
+    "MIN_CONFIDENCE": float(os.getenv("ANNOTATION_CLASSIFIER_MIN_CONFIDENCE", "0.3")),
+}
+
+# AI auto-annotation results keyed by normalized text, prompt version and model.
+# PERSIST also stores them in the AnnotationSuggestion table to survive restarts
+ANNOTATION_CACHE = {
+    "BACKEND": os.getenv("ANNOTATION_CACHE_BACKEND", "local"),
+    "CACHE_ALIAS": os.getenv("ANNOTATION_CACHE_ALIAS", "default"),
+    "TIMEOUT": int(os.getenv("ANNOTATION_CACHE_TTL", str(7 * 24 * 60 * 60))),
+    "MAX_ENTRIES": int(os.getenv("ANNOTATION_CACHE_MAX_ENTRIES", "5000")),
+    "PERSIST": os.getenv("ANNOTATION_CACHE_PERSIST", "False") == "True",
+}
+
+# Thread participants fetched from Nylas.
+# BACKEND is "local" (per process) or "django" (CACHES[CACHE_ALIAS], shared by
+# workers when SHARED_CACHE), the default with a SHARED_CACHE. Nylas webhooks
+# need the shared one to warm every worker
+PARTICIPANT_CACHE = {
+    "BACKEND": os.getenv("PARTICIPANT_CACHE_BACKEND")
+    or ("django" if SHARED_CACHE else "local"),
+    "CACHE_ALIAS": os.getenv("PARTICIPANT_CACHE_ALIAS", "default"),
+    "TIMEOUT": int(os.getenv("PARTICIPANT_CACHE_TTL", "300")),
+    "NEGATIVE_TIMEOUT": int(os.getenv("PARTICIPANT_CACHE_NEGATIVE_TTL", "30")),
+    "MAX_ENTRIES": int(os.getenv("PARTICIPANT_CACHE_MAX_ENTRIES", "2048")),
+}
+
+# Nylas message notifications (api/webhooks/nylas/). SECRET is the Nylas client
+# secret that signs deliveries; duplicates are detected in CACHES[CACHE_ALIAS]
+# for DEDUPE_TTL seconds, and participants they fetch are cached for PARTICIPANT_TTL
+NYLAS_WEBHOOK = {
+    "SECRET": os.getenv("NYLAS_CLIENT_SECRET", ""),
+    "CACHE_ALIAS": os.getenv("NYLAS_WEBHOOK_CACHE_ALIAS", "default"),
+    "DEDUPE_TTL": int(os.getenv("NYLAS_WEBHOOK_DEDUPE_TTL", str(24 * 60 * 60))),
+    "PARTICIPANT_TTL": int(os.getenv("NYLAS_WEBHOOK_PARTICIPANT_TTL", str(24 * 60 * 60))),
+    "WORKERS": int(os.getenv("NYLAS_WEBHOOK_WORKERS", "4")),
+}
+
+# Keyword arguments of main.nylas_client.NylasClient
+NYLAS_CLIENT = {
+    "pool_size": int(os.getenv("NYLAS_POOL_SIZE", "10")),
+    "max_retries": int(os.getenv("NYLAS_MAX_RETRIES", "3")),
+    "backoff_factor": float(os.getenv("NYLAS_BACKOFF_FACTOR", "0.5")),
+    "max_backoff": float(os.getenv("NYLAS_MAX_BACKOFF", "30")),
+    "timeout": (60, 90),
+    "max_concurrency": int(os.getenv("NYLAS_MAX_CONCURRENCY", "20")),
+    # no retry is started later than this many seconds after the first attempt
+    "deadline": float(os.getenv("NYLAS_DEADLINE", "120")),
 }
 
 # check if logs folder exists, else create one
@@ -137,44 +357,65 @@ LOG_DIR = os.path.join(BASE_DIR, "logs")
 if not os.path.exists(LOG_DIR):
     os.mkdir(LOG_DIR)
 
+# Records of server_log are put on a bounded queue and written by a background
+# thread (main.log.BackgroundQueueHandler), as JSON lines to rotating files.
+# LOG_DEBUG_SAMPLE_RATE is the fraction of DEBUG records kept
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
-        "verbose": {
-            "format": "[%(asctime)s] %(levelname)s [%(name)s:%(lineno)s] %(message)s",
-            "datefmt": "%d/%b/%Y %H:%M:%S",
-        },
+        "json": {"()": "main.log.JSONFormatter"},
         "simple": {"format": "%(levelname)s %(message)s"},
     },
+    "filters": {
+        "sampling": {
+            "()": "main.log.SamplingFilter",
+            "rates": {
+                "server_log": float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0")),
+            },
+        },
+    },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
             "formatter": "simple",
-            "level": "DEBUG",
+            "level": os.getenv("LOG_CONSOLE_LEVEL", "DEBUG"),
         },
         "file": {
-            "class": "logging.FileHandler",
-            "filename": "logs/debug.log",
-            "formatter": "verbose",
-            "level": "DEBUG",
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": os.path.join(LOG_DIR, "server.log"),
+            "formatter": "json",
+            "level": os.getenv("LOG_FILE_LEVEL", "DEBUG"),
+            "maxBytes": LOG_MAX_BYTES,
+            "backupCount": LOG_BACKUP_COUNT,
         },
         "error_file": {
-            "class": "logging.FileHandler",
-            "filename": "logs/error.log",
-            "formatter": "verbose",
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": os.path.join(LOG_DIR, "error.log"),
+            "formatter": "json",
             "level": "ERROR",
+            "maxBytes": LOG_MAX_BYTES,
+            "backupCount": LOG_BACKUP_COUNT,
         },
-        "info_file": {
-            "class": "logging.FileHandler",
-            "filename": "logs/info.log",
-            "formatter": "verbose",
-            "level": "INFO",
+        # must sort after the handlers it references, see BackgroundQueueHandler
+        "queue": {
+            "()": "main.log.BackgroundQueueHandler",
+            "handlers": [
+                "cfg://handlers.console",
+                "cfg://handlers.error_file",
+                "cfg://handlers.file",
+            ],
+            "queue_size": int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+            "filters": ["sampling"],
+            "level": "DEBUG",
         },
     },
     "loggers": {
         "server_log": {
-            "handlers": ["console", "error_file", "info_file", "file"],
+            "handlers": ["queue"],
             "level": "DEBUG",
         },
     },
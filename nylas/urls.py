@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from main.views import MetricsView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("main.urls")),
+    path("metrics/", MetricsView.as_view()),
 ]